@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from api import signals  # noqa: F401
+
+        backend = settings.CACHES['default']['BACKEND']
+        if backend in LOCAL_CACHE_BACKENDS and settings.WEB_CONCURRENCY > 1:
+            raise ImproperlyConfigured(
+                f'Кэш {backend} не общий для процессов, а WEB_CONCURRENCY='
+                f'{settings.WEB_CONCURRENCY}: укажите в CACHE_BACKEND '
+                'DatabaseCache, memcached или Redis.'
+            )
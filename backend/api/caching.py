@@ -0,0 +1,122 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from recipes.models import Tag
+
+USER_PROFILES_VERSION = 'user_profiles_version'
+RECIPES_VERSION = 'recipes_version'
+
+
+def get_version(key):
+    """
+    Возвращает текущую версию данных по ключу общего кэша.
+    """
+    return cache.get_or_set(key, uuid.uuid4().hex, None)
+
+
+def bump_version(key):
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+class VersionedRegistry:
+    """
+    Базовый класс процессного реестра редко меняющихся данных.
+
+    Данные строятся один раз и хранятся в памяти процесса.
+    Актуальность проверяется по ключу версии в общем кэше Django:
+    при изменении данных версия меняется, и каждый процесс
+    перестраивает свою копию при следующем обращении.
+    """
+
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get_version(self):
+        return get_version(self.version_key)
+
+    def get(self):
+        version = self.get_version()
+        data = self._data
+        if data is None or self._version != version:
+            with self._lock:
+                data = self._data
+                if data is None or self._version != version:
+                    data = self.build()
+                    self._data, self._version = data, version
+        return data
+
+    def for_request(self, request):
+        """
+        Данные реестра, версия которых проверяется один раз за запрос.
+
+        При общем кэше в memcached каждая проверка версии — сетевой
+        запрос, поэтому сериализаторы берут реестр отсюда, а не
+        обращаются к get() для каждой строки страницы.
+        """
+        if request is None:
+            return self.get()
+        # Request DRF и исходный HttpRequest делят один снимок.
+        request = getattr(request, '_request', request)
+        attribute = f'_{self.version_key}'
+        data = getattr(request, attribute, None)
+        if data is None:
+            data = self.get()
+            setattr(request, attribute, data)
+        return data
+
+    def invalidate(self):
+        bump_version(self.version_key)
+        with self._lock:
+            self._data = None
+
+
+class TagIndex:
+    """
+    Снимок таблицы тегов с готовыми представлениями для ответов API.
+    """
+
+    def __init__(self, tags):
+        from api.serializers import TagSerializer
+
+        self.tags = {tag.pk: tag for tag in tags}
+        self.data = TagSerializer(tags, many=True).data
+        self.by_id = {item['id']: item for item in self.data}
+        self.ids_by_slug = {tag.slug: tag.pk for tag in tags}
+        self.masks_by_slug = {tag.slug: tag.mask for tag in tags}
+
+    def serialize(self, pks):
+        return [self.by_id[pk] for pk in pks if pk in self.by_id]
+
+    def mask_for_slugs(self, slugs):
+        mask = 0
+        for slug in slugs:
+            mask |= self.masks_by_slug.get(slug, 0)
+        return mask
+
+
+class TagRegistry(VersionedRegistry):
+    version_key = 'tag_registry_version'
+
+    def build(self):
+        return TagIndex(list(Tag.objects.order_by('id')))
+
+    def all(self):
+        return self.get().data
+
+    def get_data(self, pk):
+        return self.get().by_id.get(pk)
+
+    def slug_choices(self):
+        return [(slug, slug) for slug in self.get().ids_by_slug]
+
+
+tag_registry = TagRegistry()
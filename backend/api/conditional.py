@@ -0,0 +1,84 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import (get_conditional_response,
+                                patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from api.response_cache import response_cache
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(
+        '|'.join(map(str, parts)).encode('utf-8'), usedforsecurity=False
+    )
+    return quote_etag(digest.hexdigest())
+
+
+def conditional_get(method):
+    """
+    Декоратор обработчика ViewSet, реализующий условные GET-запросы.
+
+    Валидаторы ответа берутся из метода представления
+    get_validators(request, *args, **kwargs), который возвращает пару
+    (части ETag, время изменения) или None, если ответ нельзя проверить
+    заранее. При совпадении валидаторов возвращается 304 без
+    сериализации данных.
+
+    Для действий из атрибута представления anonymous_cache_actions
+    данные ответа анонимному пользователю берутся из процессного кэша
+    по ключу из параметров запроса и тех же валидаторов.
+    """
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        validators = self.get_validators(request, *args, **kwargs)
+        if validators is None:
+            return method(self, request, *args, **kwargs)
+
+        etag_parts, last_modified = validators
+        etag = make_etag(request.get_full_path(), *etag_parts)
+        timestamp = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = get_response(
+                self, method, etag_parts, request, *args, **kwargs
+            )
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    return wrapper
+
+
+def get_response(view, method, etag_parts, request, *args, **kwargs):
+    if (
+        view.action not in getattr(view, 'anonymous_cache_actions', ())
+        or not request.user.is_anonymous
+    ):
+        return method(view, request, *args, **kwargs)
+
+    key = response_cache.make_key(request, view.action, *etag_parts)
+    data = response_cache.get(key)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = method(view, request, *args, **kwargs)
+    if response.status_code == 200:
+        response_cache.set(key, response.data)
+    response['X-Cache'] = 'MISS'
+    return response
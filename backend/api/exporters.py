@@ -0,0 +1,162 @@
+import csv
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+
+class Echo:
+    """
+    Псевдобуфер для csv.writer: возвращает записанную строку,
+    не накапливая её в памяти.
+    """
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartExporter:
+    """
+    Базовый класс выгрузки списка покупок.
+
+    Получает итератор строк вида (название, единица, количество)
+    и отдаёт файл клиенту по мере чтения строк из базы.
+    """
+
+    content_type = None
+    extension = None
+    title = 'Список покупок'
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def iter_content(self):
+        raise NotImplementedError
+
+    def get_filename(self):
+        return f'shopping_cart.{self.extension}'
+
+    def get_response(self):
+        response = StreamingHttpResponse(
+            self.iter_content(), content_type=self.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.get_filename()}"'
+        )
+        return response
+
+
+class CSVExporter(ShoppingCartExporter):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def iter_content(self):
+        writer = csv.writer(Echo())
+        yield '\ufeff'
+        yield writer.writerow(['Ингредиенты', 'Количество'])
+        for name, unit, amount in self.rows:
+            yield writer.writerow([f'{name} ({unit})', amount])
+
+
+class TextExporter(ShoppingCartExporter):
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def iter_content(self):
+        yield f'{self.title}\n\n'
+        for name, unit, amount in self.rows:
+            yield f'{name} ({unit}) — {amount}\n'
+
+
+class PDFExporter(ShoppingCartExporter):
+    """
+    Выгрузка в PDF с разбиением на страницы A4.
+
+    Формат PDF не допускает потоковой записи, поэтому документ
+    собирается во временном файле, который при превышении порога
+    переносится на диск, и затем отдаётся клиенту частями.
+    """
+
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    font_name = 'ShoppingCartFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+    spool_max_size = 1024 * 1024
+
+    @classmethod
+    def is_available(cls):
+        """
+        PDF доступен, если установлен reportlab и читается шрифт
+        SHOPPING_CART_PDF_FONT: без кириллического шрифта документ
+        не собрать.
+        """
+        if canvas is None:
+            return False
+        try:
+            cls.register_font()
+        except (OSError, TTFError):
+            return False
+        return True
+
+    @classmethod
+    def register_font(cls):
+        if cls.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(cls.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+
+    def _start_page(self, pdf, page_number):
+        width, height = A4
+        pdf.setFont(self.font_name, self.font_size)
+        pdf.drawString(self.margin, height - self.margin, self.title)
+        pdf.drawRightString(
+            width - self.margin, self.margin / 2, f'Страница {page_number}'
+        )
+        return height - self.margin - 2 * self.line_height
+
+    def write_document(self, output):
+        self.register_font()
+        pdf = canvas.Canvas(output, pagesize=A4)
+        page_number = 1
+        y = self._start_page(pdf, page_number)
+
+        for name, unit, amount in self.rows:
+            if y < self.margin:
+                pdf.showPage()
+                page_number += 1
+                y = self._start_page(pdf, page_number)
+            pdf.drawString(self.margin, y, f'{name} ({unit}) — {amount}')
+            y -= self.line_height
+
+        pdf.save()
+
+    def get_response(self):
+        output = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        self.write_document(output)
+        output.seek(0)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=self.get_filename(),
+            content_type=self.content_type
+        )
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (CSVExporter, TextExporter, PDFExporter)
+}
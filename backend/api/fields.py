@@ -1,15 +1,24 @@
 import base64
+import hashlib
 import imghdr
-import uuid
 
 from django.core.files.base import ContentFile
+from PIL import UnidentifiedImageError
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from api.caching import tag_registry
+from api.images import get_variant_urls, sanitize_image
 
 
 class Base64ImageField(serializers.ImageField):
     """
     Поле сериализатора для обработки изображений,
     закодированных в формате Base64.
+
+    Имя файла вычисляется по хешу содержимого. Если при изменении
+    объекта передано то же изображение, что уже сохранено, поле
+    пропускается и файл не перезаписывается.
     """
 
     def to_internal_value(self, data):
@@ -18,11 +27,74 @@ class Base64ImageField(serializers.ImageField):
             ext = format.split('/')[-1]
             img_data = base64.b64decode(imgstr)
 
-            file_name = f'{uuid.uuid4()}.{ext}'
-
             if not imghdr.what(None, img_data):
                 raise serializers.ValidationError('Неверное изображение')
 
+            try:
+                img_data = sanitize_image(img_data)
+            except (UnidentifiedImageError, OSError):
+                raise serializers.ValidationError('Неверное изображение')
+
+            file_name = f'{hashlib.sha256(img_data).hexdigest()}.{ext}'
+            if self.is_unchanged(file_name):
+                raise SkipField()
+
             data = ContentFile(img_data, name=file_name)
 
         return super().to_internal_value(data)
+
+    def is_unchanged(self, file_name):
+        instance = getattr(self.parent, 'instance', None)
+        if instance is None or not hasattr(instance, '_meta'):
+            return False
+
+        current = getattr(instance, self.source, None)
+        model_field = instance._meta.get_field(self.source)
+        return bool(current) and current.name == (
+            model_field.generate_filename(instance, file_name)
+        )
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Поле только для чтения со ссылками на уменьшенные
+    варианты изображения (миниатюра, карточка, полный размер).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        request = self.context.get('request')
+        urls = get_variant_urls(value)
+        if request is not None:
+            return {
+                variant: request.build_absolute_uri(url)
+                for variant, url in urls.items()
+            }
+        return urls
+
+
+class TagPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле первичного ключа тега, проверяющее значение
+    по реестру тегов без обращения к базе данных.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        tag = tag_registry.for_request(
+            self.context.get('request')
+        ).tags.get(pk)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
@@ -1,6 +1,17 @@
+from django.db.models import F
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.caching import tag_registry
+from api.search import search_recipes
+from recipes.models import Ingredient, Recipe
+
+
+def tag_slug_choices():
+    return tag_registry.slug_choices()
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,11 +19,16 @@ class RecipeFilter(filters.FilterSet):
     Определяет параметры фильтрации для рецептов.
     """
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-        conjoined=False
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_choices,
+        method='filter_tags'
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=(
+            ('any', 'Хотя бы один из тегов'),
+            ('all', 'Все указанные теги'),
+        ),
+        method='filter_tags_match'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -20,11 +36,59 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    ingredients = NumberInFilter(method='filter_ingredients')
+    ingredients_match = filters.ChoiceFilter(
+        choices=(
+            ('all', 'Все указанные ингредиенты'),
+            ('any', 'Хотя бы один из указанных'),
+            ('only', 'Только указанные ингредиенты'),
+        ),
+        method='filter_ingredients_match'
+    )
+    exclude_ingredients = NumberInFilter(
+        method='filter_exclude_ingredients'
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('newest', 'Сначала новые'),
+            ('popular', 'Сначала популярные'),
+        ),
+        method='filter_ordering'
+    )
+
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'popular': ('-favorites_count', '-id'),
+    }
+    ingredient_lookups = {
+        'all': 'contains',
+        'any': 'overlap',
+        'only': 'contained_by',
+    }
+    # Порядок по счётчикам меняется без изменения самих рецептов.
+    counter_orderings = ('popular',)
 
     class Meta:
         model = Recipe
         fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Проверяет теги по битовой маске tags_mask одним условием
+        на строку рецепта, без соединения с таблицей связей и DISTINCT.
+        """
+        mask = tag_registry.for_request(self.request).mask_for_slugs(value)
+        if not mask:
+            return queryset.none()
+        queryset = queryset.alias(tag_bits=F('tags_mask').bitand(mask))
+        if self.form.cleaned_data.get('tags_match') == 'all':
+            return queryset.filter(tag_bits=mask)
+        return queryset.exclude(tag_bits=0)
+
+    def filter_tags_match(self, queryset, name, value):
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value:
@@ -41,6 +105,39 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(in_shopping_cart__user=user)
         return queryset
 
+    def filter_ingredients(self, queryset, name, value):
+        """
+        Отбирает рецепты по массиву ingredient_ids через GIN-индекс:
+        со всеми указанными ингредиентами, хотя бы с одним из них
+        или только из указанных.
+        """
+        if not value:
+            return queryset
+        match = self.form.cleaned_data.get('ingredients_match') or 'all'
+        lookup = self.ingredient_lookups[match]
+        return queryset.filter(**{
+            f'ingredient_ids__{lookup}': [int(pk) for pk in value]
+        })
+
+    def filter_ingredients_match(self, queryset, name, value):
+        return queryset
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.exclude(
+            ingredient_ids__overlap=[int(pk) for pk in value]
+        )
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*self.orderings[value])
+
 
 class IngredientFilter(filters.FilterSet):
     """
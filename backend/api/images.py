@@ -0,0 +1,222 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from recipes.storage import lock_file_name
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Общий пул потоков для обработки изображений.
+
+    Pillow отпускает GIL при масштабировании и кодировании, поэтому
+    варианты одного изображения строятся параллельно, а размер пула
+    ограничивает нагрузку на процессор со стороны всех запросов.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                    thread_name_prefix='image-variants'
+                )
+    return _executor
+
+
+def get_variant_format():
+    if settings.IMAGE_VARIANT_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def get_variant_dir(name):
+    directory, file_name = os.path.split(name)
+    return os.path.join(
+        directory, VARIANTS_DIR, os.path.splitext(file_name)[0]
+    )
+
+
+def get_variant_name(name, variant):
+    """
+    Путь варианта в хранилище: recipes/abc.png превращается
+    в recipes/variants/abc/thumbnail-160-q80.webp.
+
+    Размер, качество и формат входят в имя, поэтому после изменения
+    настроек варианты получают новые адреса и не подменяют файлы,
+    которые клиенты кэшируют как неизменяемые.
+    """
+    extension = get_variant_format()[1]
+    return os.path.join(
+        get_variant_dir(name),
+        f'{variant}-{settings.IMAGE_VARIANTS[variant]}'
+        f'-q{settings.IMAGE_VARIANT_QUALITY}.{extension}'
+    )
+
+
+def get_variant_urls(field_file):
+    return {
+        variant: field_file.storage.url(
+            get_variant_name(field_file.name, variant)
+        )
+        for variant in settings.IMAGE_VARIANTS
+    }
+
+
+def sanitize_image(data):
+    """
+    Удаляет EXIF и уменьшает изображение до IMAGE_MAX_DIMENSION.
+
+    Изображение без метаданных и в допустимых размерах возвращается
+    без перекодирования.
+    """
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, 'is_animated', False):
+            return data
+        has_exif = bool(image.getexif()) or 'exif' in image.info
+        if not has_exif and max(image.size) <= max_dimension:
+            return data
+
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        output = io.BytesIO()
+        options = {'quality': 90} if image_format == 'JPEG' else {}
+        image.save(output, image_format, **options)
+        return output.getvalue()
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    image_format = get_variant_format()[0]
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        background = Image.new('RGB', variant.size, 'white')
+        variant = variant.convert('RGBA')
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    elif variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA')
+
+    output = io.BytesIO()
+    variant.save(
+        output, image_format, quality=settings.IMAGE_VARIANT_QUALITY
+    )
+    return output.getvalue()
+
+
+def generate_variants(field_file, force=False):
+    """
+    Строит недостающие варианты изображения в пуле потоков
+    и дожидается их сохранения. Возвращает число созданных файлов.
+    """
+    if not field_file:
+        return 0
+
+    storage = field_file.storage
+    missing = {
+        variant: get_variant_name(field_file.name, variant)
+        for variant in settings.IMAGE_VARIANTS
+    }
+    if not force:
+        missing = {
+            variant: name for variant, name in missing.items()
+            if not storage.exists(name)
+        }
+    if not missing:
+        return 0
+
+    with storage.open(field_file.name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    executor = get_executor()
+    futures = {
+        name: executor.submit(
+            render_variant, image, settings.IMAGE_VARIANTS[variant]
+        )
+        for variant, name in missing.items()
+    }
+    for name, future in futures.items():
+        storage.save_derived(name, ContentFile(future.result()))
+    return len(futures)
+
+
+def prune_variants(field_file):
+    """
+    Удаляет варианты, построенные с прежними настройками.
+    Возвращает число удалённых файлов.
+    """
+    if not field_file:
+        return 0
+    storage = field_file.storage
+    directory = get_variant_dir(field_file.name)
+    if not storage.exists(directory):
+        return 0
+    current = {
+        os.path.basename(get_variant_name(field_file.name, variant))
+        for variant in settings.IMAGE_VARIANTS
+    }
+    stale = [
+        file_name for file_name in storage.listdir(directory)[1]
+        if file_name not in current
+    ]
+    for file_name in stale:
+        storage.delete(os.path.join(directory, file_name))
+    return len(stale)
+
+
+def generate_variants_safely(field_file):
+    try:
+        generate_variants(field_file)
+    except Exception:
+        logger.exception(
+            'Не удалось построить варианты изображения %s', field_file.name
+        )
+
+
+def release_image(model, field_name, name):
+    """
+    Удаляет файл изображения и его варианты, если на него больше
+    не ссылается ни один объект модели.
+
+    Одинаковые загрузки хранятся одним файлом, поэтому число ссылок
+    определяется по записям в базе данных. Проверка и удаление идут
+    под блокировкой имени файла, которую хранилище держит при записи
+    до фиксации транзакции: параллельная загрузка того же файла
+    либо дождётся удаления и запишет файл заново, либо успеет
+    сохранить ссылку, и файл останется.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        lock_file_name(name)
+        if model._default_manager.filter(**{field_name: name}).exists():
+            return
+
+        storage = model._meta.get_field(field_name).storage
+        directory = get_variant_dir(name)
+        if storage.exists(directory):
+            for file_name in storage.listdir(directory)[1]:
+                storage.delete(os.path.join(directory, file_name))
+        storage.delete(name)
+
+
+def release_image_on_commit(model, field_name, name):
+    transaction.on_commit(lambda: release_image(model, field_name, name))
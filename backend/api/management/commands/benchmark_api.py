@@ -0,0 +1,215 @@
+import json
+import os
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.response_cache import response_cache
+from recipes.models import (CustomUser,
+                            Ingredient,
+                            IngredientInRecipe,
+                            Recipe,
+                            Tag)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(round(len(values) * fraction)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержки и числа запросов к базе для основных '
+        'эндпоинтов API с сохранением отчёта в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Количество замеряемых запросов к каждому эндпоинту'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Количество незамеряемых запросов перед замером'
+        )
+        parser.add_argument(
+            '--output', default='benchmark_report.json',
+            help='Путь к файлу отчёта'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Отчёт предыдущего запуска для сравнения'
+        )
+
+    def get_host(self):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.') or 'localhost'
+        return 'localhost' if host == '*' else host
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def get_endpoints(self):
+        """
+        Эндпоинты с параметрами, подобранными по текущим данным:
+        самый активный пользователь, самый плодовитый автор,
+        популярные теги и ингредиенты.
+        """
+        user = CustomUser.objects.annotate(
+            activity=Count('shopping_cart', distinct=True)
+            + Count('subscription', distinct=True)
+        ).order_by('-activity', 'id').first()
+        author = CustomUser.objects.order_by('-recipes_count', 'id').first()
+        recipe = Recipe.objects.order_by('-favorites_count', '-id').first()
+        if user is None or recipe is None:
+            return None
+
+        tags = list(Tag.objects.order_by('id').values_list('slug', flat=True))
+        ingredient_id = IngredientInRecipe.objects.values(
+            'ingredient_id'
+        ).annotate(total=Count('id')).order_by(
+            '-total'
+        ).values_list('ingredient_id', flat=True).first()
+        ingredient_name = Ingredient.objects.filter(
+            pk=ingredient_id
+        ).values_list('name', flat=True).first() or ''
+        search_word = recipe.name.split()[0]
+
+        return user, (
+            ('recipes_list_anonymous', False, '/api/recipes/', {}),
+            ('recipes_list', True, '/api/recipes/', {}),
+            ('recipes_list_cursor', True, '/api/recipes/', {'cursor': ''}),
+            ('recipes_list_tags', True, '/api/recipes/', {'tags': tags[:2]}),
+            (
+                'recipes_list_author', True, '/api/recipes/',
+                {'author': author.pk}
+            ),
+            (
+                'recipes_list_favorited', True, '/api/recipes/',
+                {'is_favorited': 1}
+            ),
+            (
+                'recipes_list_ingredients', True, '/api/recipes/',
+                {'ingredients': ingredient_id}
+            ),
+            (
+                'recipes_list_search', True, '/api/recipes/',
+                {'search': search_word}
+            ),
+            (
+                'recipes_list_popular', True, '/api/recipes/',
+                {'ordering': 'popular'}
+            ),
+            ('recipe_detail', True, f'/api/recipes/{recipe.pk}/', {}),
+            ('recipes_feed', True, '/api/recipes/feed/', {}),
+            ('subscriptions', True, '/api/users/subscriptions/', {}),
+            (
+                'download_shopping_cart', True,
+                '/api/recipes/download_shopping_cart/', {}
+            ),
+            (
+                'ingredient_search', False, '/api/ingredients/',
+                {'name': ingredient_name[:3]}
+            ),
+        )
+
+    def request(self, client, path, params, headers):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path, params, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            else:
+                response.content
+            elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise RuntimeError(
+                f'{path}: ответ {response.status_code}'
+            )
+        return elapsed, len(queries)
+
+    def measure(self, client, path, params, headers, options):
+        for _ in range(options['warmup']):
+            self.request(client, path, params, headers)
+        timings, query_counts = [], []
+        for _ in range(options['repeat']):
+            elapsed, query_count = self.request(
+                client, path, params, headers
+            )
+            timings.append(elapsed)
+            query_counts.append(query_count)
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries': max(query_counts),
+        }
+
+    def handle(self, *args, **options):
+        prepared = self.get_endpoints()
+        if prepared is None:
+            self.stdout.write(self.style.ERROR(
+                'Нет данных: сначала выполните generate_dataset'))
+            return
+        user, endpoints = prepared
+
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_HOST=self.get_host())
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        response_cache.clear()
+
+        results = {}
+        for name, authenticated, path, params in endpoints:
+            results[name] = self.measure(
+                client, path, params, auth if authenticated else {}, options
+            )
+
+        report = {
+            'commit': self.get_commit(),
+            'created_at': timezone.now().isoformat(),
+            'repeat': options['repeat'],
+            'dataset': {
+                'users': CustomUser.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'endpoints': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        previous = {}
+        if options['compare'] and os.path.exists(options['compare']):
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file).get('endpoints', {})
+
+        for name, result in results.items():
+            line = (
+                f'{name:<26} p50 {result["p50_ms"]:9.2f} мс  '
+                f'p95 {result["p95_ms"]:9.2f} мс  '
+                f'запросов {result["queries"]:3}'
+            )
+            if name in previous:
+                before = previous[name]
+                line += (
+                    f'  (было p50 {before["p50_ms"]:.2f} мс, '
+                    f'запросов {before["queries"]})'
+                )
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Отчёт сохранён в {options["output"]}'))
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientSearchIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение поиска ингредиентов через ORM и через '
+        'индекс в памяти процесса'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Количество поисковых запросов'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел'
+        )
+
+    def make_queries(self, names, count, seed):
+        rng = random.Random(seed)
+        queries = []
+        for _ in range(count):
+            name = rng.choice(names).lower()
+            length = rng.randint(1, min(5, len(name)))
+            start = 0 if rng.random() < 0.7 else rng.randint(
+                0, len(name) - length
+            )
+            queries.append(name[start:start + length])
+        return queries
+
+    def measure(self, func, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            func(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return (
+            statistics.mean(timings),
+            timings[int(len(timings) * 0.95) - 1]
+        )
+
+    def orm_search(self, query):
+        return list(
+            Ingredient.objects.filter(
+                name__icontains=query
+            ).values('id', 'name', 'measurement_unit')
+        )
+
+    def handle(self, *args, **options):
+        rows = list(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        )
+        if not rows:
+            self.stdout.write(self.style.ERROR(
+                'Нет ингредиентов: сначала выполните load_ingredients'))
+            return
+
+        started = time.perf_counter()
+        index = IngredientSearchIndex(rows)
+        build_time = (time.perf_counter() - started) * 1000
+
+        queries = self.make_queries(
+            [name for _, name, _ in rows], options['queries'], options['seed']
+        )
+        self.stdout.write(
+            f'Ингредиентов: {len(rows)}, запросов: {len(queries)}, '
+            f'лимит выдачи: {settings.INGREDIENT_SEARCH_LIMIT}, '
+            f'построение индекса: {build_time:.2f} мс'
+        )
+
+        for title, func in (
+            ('ORM (icontains)', self.orm_search),
+            ('Индекс в памяти', index.search),
+        ):
+            mean, p95 = self.measure(func, queries)
+            self.stdout.write(
+                f'{title:<20} среднее {mean:.3f} мс, p95 {p95:.3f} мс'
+            )
@@ -0,0 +1,177 @@
+import base64
+import io
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, fast_json_enabled
+
+WORDS = (
+    'курица', 'чеснок', 'сливки', 'запечь', 'нарезать', 'обжарить',
+    'духовка', 'минут', 'соль', 'перец', 'масло', 'сковорода',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение стандартных и быстрых JSON-рендерера и парсера '
+        'на страницах рецептов и запросах создания рецепта'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int,
+            default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+            help='Количество рецептов на странице'
+        )
+        parser.add_argument(
+            '--image-size', type=int, default=2 * 1024 * 1024,
+            help='Размер изображения в запросе создания, байт'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Количество повторов каждой операции'
+        )
+
+    def make_page(self, count, rng):
+        """
+        Страница рецептов в формате ответа /api/recipes/.
+        """
+        base = 'http://localhost/media/'
+
+        def text(length):
+            return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+        def variants(name):
+            return {
+                variant: f'{base}recipes/variants/{name}/{variant}.webp'
+                for variant in settings.IMAGE_VARIANTS
+            }
+
+        results = []
+        for pk in range(1, count + 1):
+            image = f'{rng.getrandbits(256):064x}'
+            avatar = f'{rng.getrandbits(256):064x}'
+            results.append({
+                'id': pk,
+                'cooking_time': rng.randint(5, 180),
+                'image': f'{base}recipes/{image}.png',
+                'image_variants': variants(image),
+                'ingredients': [
+                    {
+                        'id': rng.randint(1, 2000),
+                        'name': text(2),
+                        'measurement_unit': 'г',
+                        'amount': rng.randint(1, 1000),
+                    }
+                    for _ in range(rng.randint(3, 15))
+                ],
+                'tags': [
+                    {'id': tag, 'name': text(1), 'slug': f'tag{tag}'}
+                    for tag in range(1, rng.randint(2, 4))
+                ],
+                'is_favorited': rng.random() < 0.2,
+                'is_in_shopping_cart': rng.random() < 0.1,
+                'name': text(4),
+                'text': text(rng.randint(30, 200)),
+                'author': {
+                    'email': f'user{pk}@example.com',
+                    'id': pk,
+                    'username': f'user{pk}',
+                    'first_name': text(1),
+                    'last_name': text(1),
+                    'is_subscribed': False,
+                    'avatar': f'{base}users/{avatar}.jpg',
+                    'avatar_variants': variants(avatar),
+                },
+            })
+        return {
+            'count': count * 100,
+            'next': 'http://localhost/api/recipes/?page=2',
+            'previous': None,
+            'results': results,
+        }
+
+    def make_request_body(self, image_size, rng):
+        """
+        Тело запроса создания рецепта с изображением в base64.
+        """
+        image = base64.b64encode(os.urandom(image_size)).decode('ascii')
+        return JSONRenderer().render({
+            'name': 'Курица с чесноком',
+            'text': ' '.join(rng.choice(WORDS) for _ in range(200)),
+            'cooking_time': 40,
+            'image': f'data:image/png;base64,{image}',
+            'tags': [1, 2],
+            'ingredients': [
+                {'id': pk, 'amount': rng.randint(1, 500)}
+                for pk in range(1, 16)
+            ],
+        })
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def compare(self, title, standard, fast, repeat):
+        standard_time = self.measure(standard, repeat)
+        fast_time = self.measure(fast, repeat)
+        self.stdout.write(
+            f'{title:<32} json {standard_time:8.3f} мс, '
+            f'orjson {fast_time:8.3f} мс, '
+            f'ускорение {standard_time / fast_time:.1f}x'
+        )
+
+    def handle(self, *args, **options):
+        if not fast_json_enabled():
+            self.stdout.write(self.style.ERROR(
+                'Быстрый JSON выключен: установите orjson '
+                'и API_JSON_BACKEND=orjson'))
+            return
+
+        rng = random.Random(0)
+        page = self.make_page(options['recipes'], rng)
+        body = self.make_request_body(options['image_size'], rng)
+        standard_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+        standard_parser, fast_parser = JSONParser(), FastJSONParser()
+
+        rendered = standard_renderer.render(page)
+        if fast_renderer.render(page) != rendered:
+            self.stdout.write(self.style.ERROR(
+                'Результаты рендереров различаются'))
+            return
+        if fast_parser.parse(io.BytesIO(body)) != standard_parser.parse(
+            io.BytesIO(body)
+        ):
+            self.stdout.write(self.style.ERROR(
+                'Результаты парсеров различаются'))
+            return
+
+        self.stdout.write(
+            f'Страница: {len(page["results"])} рецептов, '
+            f'{len(rendered) / 1024:.0f} КБ; '
+            f'запрос создания: {len(body) / 1024 / 1024:.1f} МБ'
+        )
+        self.compare(
+            'Рендеринг страницы рецептов',
+            lambda: standard_renderer.render(page),
+            lambda: fast_renderer.render(page),
+            options['repeat']
+        )
+        self.compare(
+            'Разбор запроса создания рецепта',
+            lambda: standard_parser.parse(io.BytesIO(body)),
+            lambda: fast_parser.parse(io.BytesIO(body)),
+            options['repeat']
+        )
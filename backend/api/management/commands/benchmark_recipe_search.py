@@ -0,0 +1,120 @@
+import json
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.management.commands.generate_dataset import WORDS
+
+TABLE = 'benchmark_recipe_search'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение поиска рецептов через icontains и полнотекстового '
+        'поиска с GIN-индексом на синтетической таблице'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000000,
+            help='Количество синтетических рецептов'
+        )
+        parser.add_argument(
+            '--query', default='курица с чесноком',
+            help='Поисковый запрос'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество повторов каждого запроса'
+        )
+
+    def create_table(self, cursor, rows):
+        """
+        Временная таблица того же вида, что и recipes_recipe:
+        название из трёх слов, описание из тридцати и поисковый вектор
+        с теми же весами.
+        """
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {TABLE} ('
+            'id integer PRIMARY KEY, name text, text text, '
+            'search_vector tsvector)'
+        )
+        cursor.execute(
+            f'INSERT INTO {TABLE} (id, name, text) '
+            'SELECT g, '
+            "array_to_string(ARRAY(SELECT (%(words)s)[1 + floor(random() * "
+            "%(count)s)::int] FROM generate_series(1, 3) WHERE g > 0), ' '), "
+            "array_to_string(ARRAY(SELECT (%(words)s)[1 + floor(random() * "
+            "%(count)s)::int] FROM generate_series(1, 30) WHERE g > 0), ' ') "
+            'FROM generate_series(1, %(rows)s) AS g',
+            {'words': list(WORDS), 'count': len(WORDS), 'rows': rows}
+        )
+        cursor.execute(
+            f'UPDATE {TABLE} SET search_vector = '
+            "setweight(to_tsvector(%(config)s::regconfig, name), 'A') || "
+            "setweight(to_tsvector(%(config)s::regconfig, text), 'B')",
+            {'config': settings.RECIPE_SEARCH_CONFIG}
+        )
+        cursor.execute(
+            f'CREATE INDEX ON {TABLE} USING gin (search_vector)'
+        )
+        cursor.execute(f'ANALYZE {TABLE}')
+
+    def measure(self, cursor, sql, params, repeat):
+        timings = []
+        for _ in range(repeat):
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            timings.append(plan[0]['Execution Time'])
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR(
+                'Тест производительности требует PostgreSQL'))
+            return
+
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        query = options['query']
+        pattern = f'%{query}%'
+        config = settings.RECIPE_SEARCH_CONFIG
+        queries = (
+            (
+                'icontains по названию и описанию',
+                f'SELECT id FROM {TABLE} '
+                'WHERE UPPER(name) LIKE UPPER(%(pattern)s) '
+                'OR UPPER(text) LIKE UPPER(%(pattern)s) '
+                'ORDER BY id DESC LIMIT %(limit)s',
+            ),
+            (
+                'полнотекстовый поиск с ранжированием',
+                f'SELECT id, ts_rank(search_vector, q) AS rank '
+                f'FROM {TABLE}, '
+                'websearch_to_tsquery(%(config)s::regconfig, %(query)s) q '
+                'WHERE search_vector @@ q '
+                'ORDER BY rank DESC, id DESC LIMIT %(limit)s',
+            ),
+        )
+        params = {
+            'pattern': pattern, 'query': query,
+            'config': config, 'limit': page_size,
+        }
+
+        with connection.cursor() as cursor:
+            self.stdout.write(
+                f'Создание таблицы на {options["rows"]} рецептов...')
+            self.create_table(cursor, options['rows'])
+            try:
+                for title, sql in queries:
+                    timing = self.measure(
+                        cursor, sql, params, options['repeat']
+                    )
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{title}: {timing:.1f} мс'))
+            finally:
+                cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
@@ -0,0 +1,80 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import RecipeReadSerializer, RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение стоимости сериализации страницы рецептов через '
+        'RecipeSerializer и RecipeReadSerializer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int,
+            default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+            help='Количество рецептов на странице'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Количество повторов сериализации страницы'
+        )
+
+    def make_request(self):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.') or 'localhost'
+        if host == '*':
+            host = 'localhost'
+        return Request(
+            APIRequestFactory().get('/api/recipes/', HTTP_HOST=host)
+        )
+
+    def render(self, serializer_class, recipes):
+        serializer = serializer_class(
+            recipes, many=True, context={'request': self.make_request()}
+        )
+        return JSONRenderer().render(serializer.data)
+
+    def measure(self, serializer_class, recipes, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.render(serializer_class, recipes)
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) / len(recipes) * 1000000
+
+    def handle(self, *args, **options):
+        recipes = list(
+            RecipeViewSet.with_related(Recipe.objects.all())[
+                :options['rows']
+            ]
+        )
+        if not recipes:
+            self.stdout.write(self.style.ERROR('Нет рецептов'))
+            return
+
+        self.stdout.write(
+            f'Рецептов на странице: {len(recipes)}, '
+            f'повторов: {options["repeat"]}'
+        )
+        results = {}
+        for serializer_class in (RecipeSerializer, RecipeReadSerializer):
+            results[serializer_class] = self.measure(
+                serializer_class, recipes, options['repeat']
+            )
+            self.stdout.write(
+                f'{serializer_class.__name__:<22} '
+                f'{results[serializer_class]:.1f} мкс на рецепт'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Ускорение: '
+            f'{results[RecipeSerializer] / results[RecipeReadSerializer]:.1f}x'
+        ))
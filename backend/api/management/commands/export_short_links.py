@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.shortlinks import get_recipe_path
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка коротких ссылок в файл для директивы map nginx, '
+        'чтобы переходы /s/<код>/ обслуживались без обращения к backend'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.SHORT_LINK_MAP_PATH,
+            help='Путь к файлу с записями map'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+
+        links = Recipe.objects.filter(
+            short_code__isnull=False
+        ).values_list('short_code', 'id').order_by('id')
+
+        count = 0
+        with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=directory, delete=False
+        ) as file:
+            for short_code, recipe_id in links.iterator():
+                target = get_recipe_path(recipe_id)
+                file.write(f'/s/{short_code} {target};\n')
+                file.write(f'/s/{short_code}/ {target};\n')
+                count += 1
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено коротких ссылок: {count} в {path}. '
+            'Перезагрузите конфигурацию nginx (nginx -s reload).'))
@@ -0,0 +1,346 @@
+import hashlib
+import io
+import random
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (DateTimeField, ExpressionWrapper, F, Max, Min,
+                              Value)
+from django.utils import timezone
+from PIL import Image
+
+from api.caching import (RECIPES_VERSION, USER_PROFILES_VERSION,
+                         bump_version)
+from api.images import generate_variants
+from api.search import update_recipe_search_vector
+from recipes.models import (CustomUser,
+                            Favorite,
+                            FeedEntry,
+                            Ingredient,
+                            IngredientInRecipe,
+                            Recipe,
+                            ShoppingCart,
+                            ShoppingListItem,
+                            Subscription,
+                            Tag,
+                            batched,
+                            sync_ingredient_ids,
+                            tags_mask)
+
+EMAIL_DOMAIN = 'dataset.example'
+
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+
+# Слова для названий и описаний рецептов; ими же заполняет
+# синтетическую таблицу benchmark_recipe_search.
+WORDS = (
+    'курица', 'говядина', 'свинина', 'индейка', 'лосось', 'треска',
+    'креветки', 'грибы', 'картофель', 'морковь', 'лук', 'чеснок',
+    'помидоры', 'огурцы', 'капуста', 'тыква', 'баклажаны', 'перец',
+    'рис', 'гречка', 'макароны', 'фасоль', 'чечевица', 'сыр', 'сметана',
+    'сливки', 'молоко', 'яйца', 'мука', 'сахар', 'мёд', 'лимон',
+    'яблоки', 'вишня', 'шоколад', 'орехи', 'укроп', 'петрушка',
+    'запечь', 'обжарить', 'потушить', 'отварить', 'нарезать',
+    'смешать', 'посолить', 'подавать', 'духовка', 'сковорода',
+    'запечённый', 'жареный', 'тушёный', 'варёный', 'домашний', 'острый',
+    'суп', 'салат', 'пирог', 'рагу', 'котлеты', 'блины', 'соус',
+)
+
+
+def zipf_weights(count, exponent):
+    """
+    Накопленные веса распределения Ципфа: первый элемент выбирается
+    чаще всего, частота следующих убывает как 1 / rank ** exponent.
+    """
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Создание синтетических пользователей, рецептов, избранного, '
+        'корзин и подписок с неравномерным распределением'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2,
+            default=(3, 15), metavar=('MIN', 'MAX'),
+            help='Границы числа ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Период, на который распределяются даты рецептов'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные синтетические данные'
+        )
+
+    def sample_pairs(self, rng, count, left, left_weights, right,
+                     right_weights, exclude_same=False):
+        """
+        Уникальные пары (left, right), выбранные с весами.
+        Количество попыток ограничено, поэтому при плотном заполнении
+        пар может оказаться меньше запрошенного.
+        """
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            first = rng.choices(left, cum_weights=left_weights)[0]
+            second = rng.choices(right, cum_weights=right_weights)[0]
+            if exclude_same and first == second:
+                continue
+            pairs.add((first, second))
+        return sorted(pairs)
+
+    def make_image(self):
+        """
+        Общее изображение для всех синтетических рецептов,
+        сохранённое по хешу содержимого, как при загрузке через API.
+        """
+        output = io.BytesIO()
+        Image.new('RGB', (640, 480), (214, 140, 69)).save(output, 'PNG')
+        data = output.getvalue()
+        field = Recipe._meta.get_field('image')
+        name = field.storage.save(
+            f'{field.upload_to}/{hashlib.sha256(data).hexdigest()}.png',
+            ContentFile(data)
+        )
+        recipe = Recipe(image=name)
+        generate_variants(recipe.image)
+        return name
+
+    def create_users(self, count, batch_size):
+        password = make_password(None)
+        now = timezone.now()
+        users = (
+            CustomUser(
+                email=f'user{number}@{EMAIL_DOMAIN}',
+                username=f'dataset_user{number}',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+                date_joined=now - timedelta(minutes=count - number)
+            )
+            for number in range(count)
+        )
+        for batch in batched(users, batch_size):
+            CustomUser.objects.bulk_create(batch)
+        return list(
+            CustomUser.objects.filter(
+                email__endswith=f'@{EMAIL_DOMAIN}'
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, rng, options, user_ids, ingredient_ids,
+                       tags, image):
+        count = options['recipes']
+        skew = options['skew']
+        min_ingredients, max_ingredients = options['ingredients_per_recipe']
+        authors = user_ids[:]
+        rng.shuffle(authors)
+        author_weights = zipf_weights(len(authors), skew)
+        ingredient_weights = zipf_weights(len(ingredient_ids), skew)
+        tag_weights = zipf_weights(len(tags), 1)
+        recipe_ingredients = []
+
+        def recipes():
+            for number in range(count):
+                recipe_tags = set(rng.choices(
+                    tags, cum_weights=tag_weights, k=rng.randint(1, 3)
+                ))
+                ingredients = set(rng.choices(
+                    ingredient_ids, cum_weights=ingredient_weights,
+                    k=rng.randint(min_ingredients, max_ingredients)
+                ))
+                recipe_ingredients.append((recipe_tags, ingredients))
+                yield Recipe(
+                    author_id=rng.choices(
+                        authors, cum_weights=author_weights
+                    )[0],
+                    name=(
+                        f'{" ".join(rng.sample(WORDS, 3)).capitalize()} '
+                        f'№{number}'
+                    ),
+                    image=image,
+                    text=' '.join(rng.choices(WORDS, k=rng.randint(20, 80))),
+                    cooking_time=int(rng.lognormvariate(3.4, 0.6)) + 1,
+                    tags_mask=tags_mask(recipe_tags)
+                )
+
+        recipe_ids = []
+        for batch in batched(recipes(), options['batch_size']):
+            recipe_ids.extend(
+                recipe.pk for recipe in Recipe.objects.bulk_create(batch)
+            )
+
+        links = (
+            (recipe_id, recipe_tags, ingredients)
+            for recipe_id, (recipe_tags, ingredients)
+            in zip(recipe_ids, recipe_ingredients)
+        )
+        for batch in batched(links, options['batch_size']):
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.pk)
+                for recipe_id, recipe_tags, _ in batch
+                for tag in recipe_tags
+            )
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.choice((1, 2, 5, 10, 50, 100, 200, 500))
+                )
+                for recipe_id, _, ingredients in batch
+                for ingredient_id in sorted(ingredients)
+            )
+        return recipe_ids
+
+    def spread_dates(self, recipes, days):
+        """
+        Распределяет даты создания рецептов равномерно по периоду
+        в порядке идентификаторов.
+        """
+        bounds = recipes.aggregate(first=Min('id'), last=Max('id'))
+        span = max(bounds['last'] - bounds['first'], 1)
+        step = timedelta(days=days) / span
+        recipes.update(created_at=ExpressionWrapper(
+            Value(timezone.now() - timedelta(days=days))
+            + (F('id') - bounds['first']) * Value(step),
+            output_field=DateTimeField()
+        ))
+
+    def clear(self):
+        users = CustomUser.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        deleted = users.count()
+        for batch in batched(users.values_list('id', flat=True), 500):
+            CustomUser.objects.filter(pk__in=batch).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено синтетических пользователей: {deleted}'))
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+            return
+
+        if CustomUser.objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).exists():
+            self.stdout.write(self.style.ERROR(
+                'Синтетические данные уже есть: удалите их с --clear'))
+            return
+
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            self.stdout.write(self.style.ERROR(
+                'Нет ингредиентов: сначала выполните load_ingredients'))
+            return
+
+        rng = random.Random(options['seed'])
+        # Популярность ингредиентов не должна совпадать с порядком id.
+        rng.shuffle(ingredient_ids)
+        tags = list(Tag.objects.order_by('id'))
+        if not tags:
+            tags = [
+                Tag.objects.create(name=name, slug=slug)
+                for name, slug in DEFAULT_TAGS
+            ]
+        image = self.make_image()
+
+        with transaction.atomic():
+            user_ids = self.create_users(
+                options['users'], options['batch_size']
+            )
+            recipe_ids = self.create_recipes(
+                rng, options, user_ids, ingredient_ids, tags, image
+            )
+            recipes = Recipe.objects.filter(pk__in=recipe_ids)
+            self.spread_dates(recipes, options['days'])
+            sync_ingredient_ids(recipes)
+            update_recipe_search_vector(recipes)
+            self.stdout.write(
+                f'Пользователей: {len(user_ids)}, рецептов: {len(recipe_ids)}'
+            )
+
+            user_weights = zipf_weights(len(user_ids), options['skew'])
+            popular_recipes = recipe_ids[:]
+            rng.shuffle(popular_recipes)
+            recipe_weights = zipf_weights(
+                len(popular_recipes), options['skew']
+            )
+            popular_authors = user_ids[:]
+            rng.shuffle(popular_authors)
+            author_weights = zipf_weights(
+                len(popular_authors), options['skew']
+            )
+
+            relations = (
+                (Favorite, 'recipe_id', options['favorites'],
+                 popular_recipes, recipe_weights),
+                (ShoppingCart, 'recipe_id', options['carts'],
+                 popular_recipes, recipe_weights),
+                (Subscription, 'author_id', options['subscriptions'],
+                 popular_authors, author_weights),
+            )
+            pairs_by_model = {}
+            for model, field, count, targets, weights in relations:
+                pairs = self.sample_pairs(
+                    rng, count, user_ids, user_weights, targets, weights,
+                    exclude_same=model is Subscription
+                )
+                for batch in batched(pairs, options['batch_size']):
+                    model.objects.bulk_create(
+                        model(user_id=user_id, **{field: target})
+                        for user_id, target in batch
+                    )
+                pairs_by_model[model] = pairs
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: {len(pairs)}'
+                )
+
+            call_command('reconcile_counters', stdout=self.stdout)
+
+            ShoppingListItem.objects.rebuild(
+                {user_id for user_id, _ in pairs_by_model[ShoppingCart]}
+            )
+
+            followed = defaultdict(list)
+            for user_id, author_id in pairs_by_model[Subscription]:
+                followed[user_id].append(author_id)
+            for user_id, author_ids in followed.items():
+                FeedEntry.objects.follow(
+                    CustomUser(pk=user_id),
+                    [CustomUser(pk=author_id) for author_id in author_ids]
+                )
+
+        # Массовая вставка не вызывает сигналы, сбрасывающие кэши.
+        bump_version(RECIPES_VERSION)
+        bump_version(USER_PROFILES_VERSION)
+        self.stdout.write(self.style.SUCCESS('Синтетические данные созданы'))
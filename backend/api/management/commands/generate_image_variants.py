@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants, prune_variants
+from recipes.models import CustomUser, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Построение уменьшенных вариантов для уже загруженных '
+        'изображений рецептов и аватаров и удаление вариантов, '
+        'построенных с прежними настройками'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить варианты, даже если они уже существуют'
+        )
+
+    def handle(self, *args, **options):
+        sources = (
+            ('рецептов', Recipe.objects.exclude(image=''), 'image'),
+            (
+                'аватаров',
+                CustomUser.objects.exclude(avatar='').exclude(avatar=None),
+                'avatar'
+            ),
+        )
+
+        for title, queryset, field in sources:
+            created = pruned = failed = 0
+            for instance in queryset.only('pk', field).iterator():
+                field_file = getattr(instance, field)
+                try:
+                    created += generate_variants(
+                        field_file, force=options['force']
+                    )
+                    pruned += prune_variants(field_file)
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'Ошибка обработки {field_file.name}: {e}'))
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Изображения {title}: создано вариантов {created}, '
+                f'удалено устаревших {pruned}, ошибок {failed}'))
@@ -1,33 +1,122 @@
 import csv
+import json
 import os
+import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection
 
-from recipes.models import Ingredient
+from api.search import ingredient_index
+from recipes.models import Ingredient, batched
 
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов в базу данных из CSV-файла'
+    help = 'Загрузка ингредиентов в базу данных из CSV- или JSON-файла'
 
-    def handle(self, *args, **kwargs):
+    readers = ('csv', 'json')
 
-        file_path = os.path.join('/app/data', 'ingredients.csv')
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Путь к файлу с ингредиентами (.csv или .json)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=self.readers,
+            help='Формат файла, если его нельзя определить по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одной пачке вставки'
+        )
+
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            if row:
+                name, measurement_unit = row
+                yield name, measurement_unit
+
+    def read_json(self, file):
+        for item in json.load(file):
+            yield item['name'], item['measurement_unit']
+
+    def insert(self, keys):
+        """
+        Вставляет пачку ингредиентов одним INSERT ... ON CONFLICT
+        DO NOTHING и возвращает число действительно вставленных строк:
+        строки, которые параллельно успел добавить другой процесс,
+        не учитываются.
+        """
+        quote = connection.ops.quote_name
+        table = quote(Ingredient._meta.db_table)
+        name, unit = (
+            quote(Ingredient._meta.get_field(field).column)
+            for field in ('name', 'measurement_unit')
+        )
+        names, units = zip(*keys)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({name}, {unit}) '
+                'SELECT * FROM unnest(%s::text[], %s::text[]) '
+                'ON CONFLICT DO NOTHING RETURNING 1',
+                [list(names), list(units)]
+            )
+            return len(cursor.fetchall())
+
+    def load(self, rows, batch_size):
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        read = created = 0
+
+        for batch in batched(rows, batch_size):
+            read += len(batch)
+
+            new = []
+            for name, measurement_unit in batch:
+                key = (name.strip(), measurement_unit.strip())
+                if key not in existing:
+                    existing.add(key)
+                    new.append(key)
+            if new:
+                created += self.insert(new)
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{read} записей обработано ...'))
+
+        return read, created
+
+    def handle(self, *args, **options):
+        file_path = options['path']
+        file_format = options['format'] or (
+            os.path.splitext(file_path)[1].lstrip('.').lower()
+        )
+
+        if file_format not in self.readers:
+            self.stdout.write(self.style.ERROR(
+                f'Неизвестный формат файла: {file_path}'))
+            return
 
         try:
+            started = time.perf_counter()
             with open(file_path, mode='r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                count = 0
-                for row in reader:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name, measurement_unit=measurement_unit
-                    )
-                    count += 1
-                    if count % 100 == 0:
-                        self.stdout.write(self.style.SUCCESS(
-                            f'{count} записей обработано ...'))
+                rows = getattr(self, f'read_{file_format}')(file)
+                read, created = self.load(rows, options['batch_size'])
+            elapsed = time.perf_counter() - started
+
+            if created:
+                ingredient_index.invalidate()
+
             self.stdout.write(self.style.SUCCESS(
-                'Ингредиенты успешно загружены'))
+                f'Ингредиенты успешно загружены: прочитано {read}, '
+                f'добавлено {created}, пропущено {read - created} '
+                f'за {elapsed:.2f} с '
+                f'({read / elapsed if elapsed else read:.0f} строк/с)'))
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR(f'Файл не найден: {file_path}'))
         except Exception as e:
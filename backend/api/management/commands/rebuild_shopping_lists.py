@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка и пересборка агрегированных списков покупок '
+        'по содержимому корзин'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не изменяя данные'
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='ID пользователя (можно указать несколько раз)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        expected = defaultdict(dict)
+        for (user_id, ingredient_id), amount in (
+            ShoppingListItem.objects.expected_amounts(user_ids).items()
+        ):
+            expected[user_id][ingredient_id] = amount
+
+        stored = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        actual = defaultdict(dict)
+        for user_id, ingredient_id, amount in stored.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator():
+            actual[user_id][ingredient_id] = amount
+
+        broken = sorted(
+            user_id for user_id in {*expected, *actual}
+            if expected.get(user_id, {}) != actual.get(user_id, {})
+        )
+
+        if not broken:
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок согласованы с корзинами'))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f'Расхождения у пользователей: '
+            f'{", ".join(map(str, broken))}'))
+
+        if options['check']:
+            return
+
+        ShoppingListItem.objects.rebuild(broken)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано списков покупок: {len(broken)}'))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import (CustomUser,
+                            Favorite,
+                            Recipe,
+                            ShoppingCart,
+                            Subscription)
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка и исправление счётчиков избранного, корзин, '
+        'рецептов и подписчиков'
+    )
+
+    counters = (
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+        (CustomUser, 'recipes_count', Recipe, 'author'),
+        (CustomUser, 'subscribers_count', Subscription, 'author'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не изменяя данные'
+        )
+
+    def actual_count(self, related, related_field):
+        counts = related.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total')
+        return Coalesce(Subquery(counts), 0)
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+
+        for model, field, related, related_field in self.counters:
+            actual = self.actual_count(related, related_field)
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            ).values_list('pk', flat=True)
+            drifted_count = drifted.count()
+            drifted_total += drifted_count
+
+            if not drifted_count:
+                continue
+
+            self.stdout.write(self.style.WARNING(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'расхождений {drifted_count}'))
+
+            if not options['check']:
+                model.objects.filter(pk__in=drifted).update(**{field: actual})
+
+        if not drifted_total:
+            self.stdout.write(self.style.SUCCESS('Счётчики согласованы'))
+        elif not options['check']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счётчиков: {drifted_total}'))
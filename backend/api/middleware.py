@@ -0,0 +1,159 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponseRedirect
+
+from api.shortlinks import SHORT_LINK_PATH, resolve_short_code
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_SQL_LENGTH = 1000
+
+
+class QueryStats:
+    """
+    Статистика запросов к базе за время обработки одного запроса.
+
+    Повторами считаются выполнения одного и того же SQL-шаблона:
+    параметры не сравниваются, поэтому N+1 тоже попадает в повторы.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            self.statements[sql] += 1
+            if duration > self.slowest_duration:
+                self.slowest_duration = duration
+                self.slowest_sql = sql
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.duration * 1000:.1f};'
+            f'desc="{self.count} queries, {self.duplicates} duplicates", '
+            f'db-slowest;dur={self.slowest_duration * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+    def as_log(self, request, response, view, total):
+        return {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 1),
+            'duplicates': self.duplicates,
+            'slowest_ms': round(self.slowest_duration * 1000, 1),
+            'slowest_sql': (
+                self.slowest_sql[:SLOWEST_SQL_LENGTH]
+                if self.slowest_sql else None
+            ),
+        }
+
+
+def view_name(view_func):
+    """
+    Имя представления в виде RecipeViewSet.list для вьюсетов DRF
+    и имя класса или функции для остальных представлений.
+    """
+    view_class = getattr(view_func, 'cls', None) or getattr(
+        view_func, 'view_class', None
+    )
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    return view_class.__name__
+
+
+class SQLTimingMiddleware:
+    """
+    Замеряет запросы к базе, выполненные при обработке запроса,
+    и отдаёт их число, суммарное время и самый медленный запрос
+    в заголовке Server-Timing и в строке лога в формате JSON.
+
+    Замеряется доля запросов SQL_INSTRUMENTATION_SAMPLE_RATE;
+    при нулевой доле middleware отключается при старте и ничего
+    не стоит. Запросы, выполняемые при чтении потокового ответа,
+    не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.SQL_INSTRUMENTATION_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = stats.server_timing(total)
+        logger.info(
+            json.dumps(
+                stats.as_log(
+                    request, response,
+                    getattr(request, 'sql_timing_view', None), total
+                ),
+                ensure_ascii=False
+            )
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = view_name(view_func)
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            name = f'{name}.{actions.get(request.method.lower(), "-")}'
+        request.sql_timing_view = name
+
+
+class ShortLinkMiddleware:
+    """
+    Обрабатывает переходы по коротким ссылкам /s/<код>/ до сессий,
+    CSRF и аутентификации: для редиректа они не нужны.
+
+    Неизвестные коды передаются дальше и завершаются ответом 404
+    из обычного представления.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        match = SHORT_LINK_PATH.match(request.path_info)
+        if match:
+            path = resolve_short_code(match['short_code'])
+            if path is not None:
+                return HttpResponseRedirect(path)
+        return self.get_response(request)
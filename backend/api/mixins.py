@@ -1,7 +1,15 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import Subscription
+from api.viewer_state import ViewerState
+from recipes.models import (Favorite,
+                            Recipe,
+                            ShoppingCart,
+                            ShoppingListItem,
+                            add_relations,
+                            change_counters,
+                            remove_relations)
 
 
 class IsSubscribedMixin:
@@ -16,25 +24,56 @@ class IsSubscribedMixin:
             request, 'user'
         ) and request.user.is_authenticated:
 
-            return Subscription.objects.filter(
-                user=request.user, author=obj
-            ).exists()
+            return ViewerState.for_request(request).is_subscribed(obj.pk)
 
         return False
 
 
+class ViewerStateListSerializerMixin:
+    """
+    Миксин для списочных сериализаторов, заранее загружающий
+    состояние текущего пользователя для всех объектов страницы.
+    """
+
+    def prime_viewer_state(self, viewer_state, items):
+        raise NotImplementedError
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request is not None and hasattr(request, 'user'):
+            self.prime_viewer_state(
+                ViewerState.for_request(request), items
+            )
+        return super().to_representation(items)
+
+
 class RecipeActionMixin:
     """
     Миксин для добавления или удаления рецепта в/из избранного или корзины.
     """
 
+    counter_fields = {
+        Favorite: 'favorites_count',
+        ShoppingCart: 'in_carts_count',
+    }
+
     def check_recipe_action(self, request, model, serializer_class):
         recipe = self.get_object()
         user = request.user
+        viewer_state = ViewerState.for_request(request)
 
         if request.method == 'POST':
-            obj, created = model.objects.get_or_create(
-                user=user, recipe=recipe)
+            with transaction.atomic():
+                obj, created = model.objects.get_or_create(
+                    user=user, recipe=recipe)
+                if created:
+                    change_counters(
+                        Recipe.objects.filter(pk=recipe.pk),
+                        **{self.counter_fields[model]: 1}
+                    )
+                if created and model is ShoppingCart:
+                    ShoppingListItem.objects.add_recipe(user, recipe)
 
             if not created:
                 return Response(
@@ -42,16 +81,88 @@ class RecipeActionMixin:
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            viewer_state.set_recipe_flag(model, recipe.pk, True)
             data = serializer_class(recipe, context={'request': request}).data
             return Response(data, status=status.HTTP_201_CREATED)
 
-        obj = model.objects.filter(user=user, recipe=recipe).first()
+        with transaction.atomic():
+            # Удалённое число строк защищает от повторного вычитания,
+            # если ту же запись параллельно удалил другой запрос.
+            deleted, _ = model.objects.filter(
+                user=user, recipe=recipe
+            ).delete()
+            if deleted:
+                change_counters(
+                    Recipe.objects.filter(pk=recipe.pk),
+                    **{self.counter_fields[model]: -1}
+                )
+            if deleted and model is ShoppingCart:
+                ShoppingListItem.objects.remove_recipe(user, recipe)
 
-        if not obj:
+        if not deleted:
             return Response(
                 {'detail': 'Рецепт не найден.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        obj.delete()
+        viewer_state.set_recipe_flag(model, recipe.pk, False)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def batch_recipe_action(self, request, model):
+        """
+        Добавляет или удаляет несколько рецептов одним запросом:
+        одна массовая вставка или одно удаление, один UPDATE счётчиков.
+
+        В ответе для каждого идентификатора указан результат:
+        created, exists, deleted, absent или not_found.
+        """
+        from api.serializers import BatchActionSerializer
+
+        serializer = BatchActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        adding = request.method == 'POST'
+
+        with transaction.atomic():
+            found = set(
+                Recipe.objects.filter(pk__in=ids).values_list('pk', flat=True)
+            )
+            # Побочные эффекты применяются только к строкам, которые
+            # этот запрос действительно вставил или удалил.
+            if adding:
+                changed = add_relations(
+                    model, user, 'recipe', [pk for pk in ids if pk in found]
+                )
+                statuses = ('created', 'exists')
+            else:
+                changed = remove_relations(model, user, 'recipe', found)
+                statuses = ('deleted', 'absent')
+
+            if changed:
+                change_counters(
+                    Recipe.objects.filter(pk__in=changed),
+                    **{self.counter_fields[model]: 1 if adding else -1}
+                )
+            if changed and model is ShoppingCart:
+                if adding:
+                    ShoppingListItem.objects.add_recipes(user, changed)
+                else:
+                    ShoppingListItem.objects.remove_recipes(user, changed)
+
+        if changed:
+            viewer_state = ViewerState.for_request(request)
+            viewer_state.set_recipe_flags(model, changed, adding)
+            viewer_state.touch()
+
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else statuses[0] if pk in changed
+                    else statuses[1]
+                )
+            }
+            for pk in ids
+        ]})
@@ -1,10 +1,301 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import (EmptyPage, Page, PageNotAnInteger,
+                                   Paginator)
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 PAGE_SIZE = settings.REST_FRAMEWORK['PAGE_SIZE']
 
 
+def estimate_count(queryset):
+    """
+    Оценка числа строк запроса по статистике планировщика PostgreSQL.
+
+    Для запроса без условий берётся reltuples из pg_class, для запроса
+    с фильтрами — оценка строк из EXPLAIN. Возвращает None, если
+    оценка недоступна.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table,)
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+        else:
+            sql, params = query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+
+    return int(estimate) if estimate >= 0 else None
+
+
+class ApproximatePage(Page):
+    """
+    Страница с приблизительным общим числом объектов: наличие
+    следующей страницы определяется по лишней загруженной строке.
+    """
+
+    def __init__(self, object_list, number, paginator, has_more):
+        self.has_more = has_more
+        super().__init__(object_list, number, paginator)
+
+    def has_next(self):
+        return self.has_more
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших таблиц заменяет COUNT(*)
+    оценкой планировщика.
+
+    Оценка используется, только если она не меньше порога из настройки
+    threshold_setting; для небольших выборок число объектов
+    считается точно.
+    """
+
+    threshold_setting = 'PAGINATION_APPROXIMATE_COUNT_THRESHOLD'
+
+    @cached_property
+    def is_approximate(self):
+        threshold = getattr(settings, self.threshold_setting)
+        if not threshold or not hasattr(self.object_list, 'query'):
+            return False
+        self.estimate = estimate_count(self.object_list)
+        return self.estimate is not None and self.estimate >= threshold
+
+    @cached_property
+    def count(self):
+        if self.is_approximate:
+            return self.estimate
+        return super().count
+
+    def page(self, number):
+        if not self.is_approximate:
+            return super().page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        rows = list(self.object_list[bottom:top + 1])
+        if not rows and number > 1:
+            raise EmptyPage('Страница не содержит результатов')
+
+        # Страница остаётся QuerySet (например, для формсета
+        # list_editable в админке), но повторно не запрашивается.
+        object_list = self.object_list[bottom:top]
+        object_list._result_cache = rows[:self.per_page]
+        object_list._prefetch_done = True
+        return ApproximatePage(
+            object_list, number, self, has_more=len(rows) > self.per_page
+        )
+
+    def validate_number(self, number):
+        if not self.is_approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не является целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным режимом курсора.
+
+    Если в запросе передан параметр cursor (в том числе пустой),
+    выдача строится по ключу сортировки выборки без OFFSET и COUNT(*):
+    страница ищется по индексу, и время ответа не зависит от её номера.
+    Последнее поле сортировки должно быть уникальным.
+    С cursor_by_default режим курсора включён всегда.
+    """
+
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
     max_page_size = PAGE_SIZE
+    django_paginator_class = ApproximateCountPaginator
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    cursor_by_default = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            self.cursor_by_default
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_sources((queryset,), request)
+
+    def paginate_sources(self, sources, request):
+        """
+        Страница курсорной пагинации, собранная из нескольких выборок
+        с одинаковыми полями сортировки.
+
+        Каждая выборка читается по ключу не более чем на страницу
+        вперёд, результаты сливаются в общем порядке; строки
+        с совпадающим ключом выдаются один раз.
+        """
+        self.use_cursor = True
+        self.request = request
+        self.ordering = self.get_ordering(sources[0])
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request, sources[0])
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+
+        results = []
+        for queryset in sources:
+            queryset = queryset.order_by(*ordering)
+            if values is not None:
+                queryset = queryset.filter(self.after(ordering, values))
+            results.extend(queryset[:page_size + 1])
+
+        if len(sources) > 1:
+            unique = {}
+            for item in results:
+                unique.setdefault(tuple(self.get_values(item)), item)
+            results = [
+                unique[key] for key in sorted(
+                    unique, reverse=ordering[0].startswith('-')
+                )
+            ]
+
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        has_next, has_previous = (
+            (values is not None, has_more) if reverse
+            else (has_more, values is not None)
+        )
+        self.next_values = (
+            self.get_values(results[-1]) if has_next and results else None
+        )
+        self.previous_values = (
+            self.get_values(results[0]) if has_previous and results else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_cursor_link(self.next_values, False)),
+            ('previous', self.get_cursor_link(self.previous_values, True)),
+            ('results', data)
+        ]))
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return tuple(ordering) or ('pk',)
+
+    def get_values(self, instance):
+        return [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def after(self, ordering, values):
+        """
+        Условие «строго после ключа» для сортировки ordering.
+
+        Для первого поля добавляется нестрогая граница, по которой
+        PostgreSQL может сразу перейти к нужному месту индекса.
+        """
+        lookups = [
+            (field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')
+            for field in ordering
+        ]
+        condition, equal = Q(), Q()
+        for (name, lookup), value in zip(lookups, values):
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first_name, first_lookup = lookups[0]
+        return Q(**{f'{first_name}__{first_lookup}e': values[0]}) & condition
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            raw_values = cursor['v']
+            if len(raw_values) != len(self.ordering):
+                raise ValueError
+            values = [
+                self.get_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, raw_values)
+            ]
+            return values, bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error,
+                UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_field(queryset, field):
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        if name == 'pk':
+            return queryset.model._meta.pk
+        return queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, values, reverse):
+        data = {'v': [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ]}
+        if reverse:
+            data['r'] = 1
+        return base64.urlsafe_b64encode(
+            json.dumps(data, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+
+    def get_cursor_link(self, values, reverse):
+        if values is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(values, reverse)
+        )
+
+
+class FeedPagination(CustomPagination):
+    cursor_by_default = True
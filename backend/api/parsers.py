@@ -0,0 +1,44 @@
+import codecs
+import io
+
+from rest_framework.parsers import JSONParser
+
+from api.renderers import (FastJSONRenderer, contains_float,
+                           fast_json_enabled, orjson)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson для тел запросов в UTF-8.
+
+    Тело читается целиком и разбирается без промежуточного
+    декодирования в str, что заметно на больших запросах
+    с изображениями в base64. Другие кодировки разбираются
+    стандартным JSONParser.
+
+    Тела, которые orjson не принимает или разбирает в дробные числа
+    (в том числе целые длиннее 64 бит), разбираются повторно
+    стандартным JSONParser, чтобы результат и текст ошибки
+    совпадали с DRF.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if (
+            not fast_json_enabled()
+            or not self.strict
+            or codecs.lookup(encoding).name != 'utf-8'
+        ):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if not contains_float(data):
+                return data
+        return super().parse(io.BytesIO(body), media_type, parser_context)
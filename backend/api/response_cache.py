@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.http import urlencode
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Процессный кэш данных ответов для анонимных пользователей.
+
+    Ключ включает нормализованные параметры запроса и версии данных
+    из общего кэша Django, от которых зависит ответ. Версия меняется
+    при изменении данных в любом процессе, поэтому старые записи
+    больше не запрашиваются ни одним процессом и вытесняются по LRU
+    или по истечении RESPONSE_CACHE_TTL. Для этого кэш Django должен
+    быть общим: с LocMemCache при WEB_CONCURRENCY > 1 приложение
+    не запускается (см. ApiConfig.ready).
+
+    Счётчики попаданий, промахов и вытеснений раз в
+    RESPONSE_CACHE_STATS_INTERVAL секунд пишутся в лог строкой JSON:
+    кэш свой у каждого процесса, поэтому снаружи их не прочитать.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._reported_at = time.monotonic()
+
+    @staticmethod
+    def make_key(request, *parts):
+        params = urlencode(sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+        ))
+        digest = hashlib.md5(
+            '|'.join(map(str, (
+                request.build_absolute_uri(request.path), params, *parts
+            ))).encode('utf-8'),
+            usedforsecurity=False
+        )
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                entry = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        self.report_stats()
+        return None if entry is None else entry[1]
+
+    def set(self, key, data):
+        expires_at = time.monotonic() + settings.RESPONSE_CACHE_TTL
+        with self._lock:
+            self._entries[key] = (expires_at, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.RESPONSE_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def report_stats(self):
+        interval = settings.RESPONSE_CACHE_STATS_INTERVAL
+        now = time.monotonic()
+        with self._lock:
+            if interval <= 0 or now - self._reported_at < interval:
+                return
+            self._reported_at = now
+        logger.info(json.dumps({'response_cache': self.stats()}))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+response_cache = ResponseCache()
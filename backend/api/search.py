@@ -0,0 +1,134 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery,
+                                            SearchRank,
+                                            SearchVector)
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from api.caching import VersionedRegistry
+from recipes.models import Ingredient
+
+
+class IngredientSearchIndex:
+    """
+    Поисковый индекс по названиям ингредиентов.
+
+    Хранит отсортированный массив названий для поиска по префиксу
+    и триграммный индекс для поиска по подстроке.
+    """
+
+    ngram_size = 3
+
+    def __init__(self, rows):
+        self.items = sorted(
+            (
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for pk, name, unit in rows
+            ),
+            key=lambda item: (item['name'].lower(), item['id'])
+        )
+        self.keys = [item['name'].lower() for item in self.items]
+        self.ngrams = {}
+        for position, key in enumerate(self.keys):
+            for ngram in self._split(key):
+                self.ngrams.setdefault(ngram, []).append(position)
+
+    def _split(self, value):
+        return {
+            value[i:i + self.ngram_size]
+            for i in range(len(value) - self.ngram_size + 1)
+        }
+
+    def _prefix_positions(self, query):
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.keys)
+            and self.keys[position].startswith(query)
+        ):
+            yield position
+            position += 1
+
+    def _substring_positions(self, query):
+        ngrams = self._split(query)
+        if not ngrams:
+            candidates = range(len(self.keys))
+        else:
+            postings = sorted(
+                (self.ngrams.get(ngram, ()) for ngram in ngrams), key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+            candidates = sorted(candidates)
+        for position in candidates:
+            key = self.keys[position]
+            if query in key and not key.startswith(query):
+                yield position
+
+    def search(self, query, prefix_only=False, limit=None):
+        """
+        Возвращает ингредиенты, у которых название начинается с запроса,
+        а затем те, где запрос встречается внутри названия.
+        """
+        query = query.strip().lower()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        results = []
+        sources = [self._prefix_positions(query)]
+        if not prefix_only:
+            sources.append(self._substring_positions(query))
+
+        for source in sources:
+            for position in source:
+                if len(results) >= limit:
+                    return results
+                results.append(self.items[position])
+        return results
+
+
+class IngredientIndex(VersionedRegistry):
+    version_key = 'ingredient_index_version'
+
+    def build(self):
+        return IngredientSearchIndex(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        )
+
+    def search(self, query, prefix_only=False, limit=None):
+        return self.get().search(query, prefix_only, limit)
+
+
+ingredient_index = IngredientIndex()
+
+
+def recipe_search_vector():
+    """
+    Поисковый вектор рецепта: совпадения в названии весят больше,
+    чем в описании.
+    """
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+    )
+
+
+def update_recipe_search_vector(queryset):
+    return queryset.update(search_vector=recipe_search_vector())
+
+
+def search_recipes(queryset, query):
+    """
+    Отбирает рецепты по поисковому вектору через GIN-индекс
+    и сортирует их по релевантности.
+
+    Релевантность приводится к double precision, чтобы её значение
+    без потерь передавалось в курсоре пагинации.
+    """
+    search_query = SearchQuery(
+        query, config=settings.RECIPE_SEARCH_CONFIG, search_type='websearch'
+    )
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=Cast(
+            SearchRank(F('search_vector'), search_query), FloatField()
+        )
+    ).order_by('-rank', '-id')
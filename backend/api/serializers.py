@@ -1,15 +1,27 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from api.fields import Base64ImageField
-from api.mixins import IsSubscribedMixin
-from recipes.models import (Favorite,
+from api.caching import tag_registry
+from api.fields import (Base64ImageField,
+                        ImageVariantsField,
+                        TagPrimaryKeyField)
+from api.images import get_variant_urls, release_image_on_commit
+from api.mixins import IsSubscribedMixin, ViewerStateListSerializerMixin
+from api.shortlinks import get_short_code
+from api.viewer_state import ViewerState
+from recipes.models import (FeedEntry,
                             Ingredient,
                             IngredientInRecipe,
                             Recipe,
-                            ShoppingCart,
-                            Tag
+                            ShoppingListItem,
+                            Tag,
+                            sync_ingredient_ids,
+                            tags_mask
                             )
 
 
@@ -41,19 +53,43 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
+class UserListSerializer(
+        ViewerStateListSerializerMixin, serializers.ListSerializer):
+    """
+    Списочный сериализатор пользователей, загружающий подписки
+    текущего пользователя одним запросом на страницу.
+    """
+
+    def prime_viewer_state(self, viewer_state, items):
+        viewer_state.prime_authors(user.pk for user in items)
+
+
+class RecipeListSerializer(
+        ViewerStateListSerializerMixin, serializers.ListSerializer):
+    """
+    Списочный сериализатор рецептов, загружающий избранное, корзину
+    и подписки текущего пользователя одним запросом на каждый признак.
+    """
+
+    def prime_viewer_state(self, viewer_state, items):
+        viewer_state.prime_recipes(items)
+
+
 class UserSerializer(serializers.ModelSerializer, IsSubscribedMixin):
     """
     Сериализатор для представления информации о пользователях.
     """
 
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar'
+            'last_name', 'is_subscribed', 'avatar', 'avatar_variants'
         )
+        list_serializer_class = UserListSerializer
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
@@ -61,9 +97,55 @@ class RecipeShortSerializer(serializers.ModelSerializer):
     Сериализатор для краткого представления рецептов.
     """
 
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class UserSubscriptionListSerializer(UserListSerializer):
+    """
+    Списочный сериализатор подписок, загружающий превью рецептов
+    всех авторов страницы одним оконным запросом.
+    """
+
+    preview_fields = ('id', 'name', 'image', 'cooking_time', 'author_id')
+
+    def load_recipe_previews(self, author_ids, recipes_limit):
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids
+        ).only(*self.preview_fields)
+
+        if recipes_limit:
+            ranked = recipes.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=F('id').asc()
+                )
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                'WHERE ranked.row_number <= %s ORDER BY ranked.id',
+                (*params, recipes_limit)
+            )
+        else:
+            recipes = recipes.order_by('id')
+
+        previews = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+    def to_representation(self, data):
+        authors = list(data.all() if hasattr(data, 'all') else data)
+        self.context['recipe_previews'] = self.load_recipe_previews(
+            [author.pk for author in authors],
+            self.child.get_recipes_limit()
+        )
+        return super().to_representation(authors)
 
 
 class UserSubscriptionSerializer(
@@ -76,16 +158,18 @@ class UserSubscriptionSerializer(
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed', 'recipes', 'recipes_count', 'avatar'
+            'is_subscribed', 'recipes', 'recipes_count', 'avatar',
+            'avatar_variants'
         )
+        list_serializer_class = UserSubscriptionListSerializer
 
-    def get_recipes(self, obj):
-
+    def get_recipes_limit(self):
         recipes_limit = self.context.get('recipes_limit')
 
         if recipes_limit is not None:
@@ -95,14 +179,22 @@ class UserSubscriptionSerializer(
                 raise serializers.ValidationError(
                     'recipes_limit должен быть числом.')
 
-        recipes = Recipe.objects.filter(author=obj)
-        if recipes_limit:
-            recipes = recipes[:recipes_limit]
+        return recipes_limit
+
+    def get_recipes(self, obj):
+        previews = self.context.get('recipe_previews')
+        if previews is not None:
+            recipes = previews[obj.pk]
+        else:
+            recipes_limit = self.get_recipes_limit()
+            recipes = Recipe.objects.filter(author=obj).order_by('id')
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
 
         return RecipeShortSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -128,7 +220,7 @@ class AvatarSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
 
-        if 'avatar' not in data:
+        if 'avatar' not in data and not self.initial_data.get('avatar'):
             raise serializers.ValidationError(
                 {'avatar': 'Это поле обязательно для заполнения.'}
             )
@@ -140,9 +232,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
     Сериализатор для работы с ингредиентами, использующимися в рецептах.
     """
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source='ingredient.id'
-    )
+    id = serializers.IntegerField(source='ingredient.id')
     name = serializers.CharField(source='ingredient.name', read_only=True)
     measurement_unit = serializers.CharField(
         source='ingredient.measurement_unit', read_only=True
@@ -161,23 +251,29 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     cooking_time = serializers.IntegerField(min_value=1)
     image = Base64ImageField(max_length=None, use_url=True)
+    image_variants = ImageVariantsField(source='image')
     ingredients = IngredientInRecipeSerializer(
         source='ingredient_in_recipes', many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = TagPrimaryKeyField(queryset=Tag.objects.all(), many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = (
+            'short_code', 'created_at', 'updated_at',
+            'favorites_count', 'in_carts_count', 'search_vector',
+            'ingredient_ids', 'tags_mask', 'fanned_out'
+        )
         read_only_fields = ('author',)
+        list_serializer_class = RecipeListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['tags'] = TagSerializer(
-            instance.tags.all(), many=True).data
+        representation['tags'] = tag_registry.for_request(
+            self.context.get('request')
+        ).serialize(tag.pk for tag in instance.tags.all())
         representation['author'] = UserSerializer(
             instance.author, context=self.context
         ).data
@@ -210,6 +306,19 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Список ингредиентов содержит дубликаты.')
 
+        # Все ингредиенты проверяются одним запросом, а не по одному
+        # запросу на элемент, как у PrimaryKeyRelatedField.
+        instances = Ingredient.objects.in_bulk(ingredient_ids)
+        for ingredient in ingredients:
+            pk = ingredient['ingredient']['id']
+            if pk not in instances:
+                raise serializers.ValidationError(
+                    serializers.PrimaryKeyRelatedField.default_error_messages[
+                        'does_not_exist'
+                    ].format(pk_value=pk)
+                )
+            ingredient['ingredient']['id'] = instances[pk]
+
         return ingredients
 
     def validate_tags(self, tags):
@@ -225,6 +334,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def _process_ingredients(self, recipe, ingredients_data):
 
+        old_amounts = ShoppingListItem.objects.recipe_amounts(recipe)
         recipe.ingredients.clear()
 
         ingredient_instances = [
@@ -236,23 +346,46 @@ class RecipeSerializer(serializers.ModelSerializer):
             for ingredient_data in ingredients_data
         ]
         IngredientInRecipe.objects.bulk_create(ingredient_instances)
+        sync_ingredient_ids(Recipe.objects.filter(pk=recipe.pk))
+
+        if old_amounts:
+            ShoppingListItem.objects.change_recipe(
+                recipe,
+                old_amounts,
+                {
+                    instance.ingredient.pk: instance.amount
+                    for instance in ingredient_instances
+                }
+            )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredient_in_recipes')
 
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data, tags_mask=tags_mask(tags)
+        )
+        get_short_code(recipe)
         self._process_ingredients(recipe, ingredients_data)
         recipe.tags.set(tags)
+        FeedEntry.objects.fan_out(recipe)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags', None)
         ingredients_data = validated_data.pop('ingredient_in_recipes', None)
+        old_image = instance.image.name
+        if tags_data is not None:
+            validated_data['tags_mask'] = tags_mask(tags_data)
 
         instance = super().update(instance, validated_data)
 
+        if instance.image.name != old_image:
+            release_image_on_commit(Recipe, 'image', old_image)
+
         if tags_data is not None:
             instance.tags.set(tags_data)
 
@@ -262,26 +395,134 @@ class RecipeSerializer(serializers.ModelSerializer):
         return instance
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Favorite.objects.filter(user=user, recipe=obj).exists()
+        request = self.context['request']
+        if request.user.is_authenticated:
+            return ViewerState.for_request(request).is_favorited(obj.pk)
         return False
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
+        request = self.context['request']
+        if request.user.is_authenticated:
+            return ViewerState.for_request(request).is_in_shopping_cart(
+                obj.pk
+            )
         return False
 
 
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """
+    Сериализатор рецептов только для чтения: списки, просмотр и лента.
+
+    Выдаёт те же данные, что и RecipeSerializer, но собирает словари
+    напрямую из загруженных объектов, не создавая поля DRF и вложенные
+    сериализаторы для каждой строки. Представления авторов строятся
+    один раз на страницу.
+    """
+
+    class Meta:
+        list_serializer_class = RecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._authors = {}
+
+    def file_url(self, field_file):
+        if not field_file:
+            return None
+        return self.context['request'].build_absolute_uri(field_file.url)
+
+    def variant_urls(self, field_file):
+        if not field_file:
+            return None
+        build_absolute_uri = self.context['request'].build_absolute_uri
+        return {
+            variant: build_absolute_uri(url)
+            for variant, url in get_variant_urls(field_file).items()
+        }
+
+    def author_representation(self, author, viewer_state):
+        representation = self._authors.get(author.pk)
+        if representation is None:
+            representation = self._authors[author.pk] = {
+                'email': author.email,
+                'id': author.pk,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+                'is_subscribed': (
+                    viewer_state is not None
+                    and viewer_state.is_subscribed(author.pk)
+                ),
+                'avatar': self.file_url(author.avatar),
+                'avatar_variants': self.variant_urls(author.avatar),
+            }
+        return representation
+
+    def to_representation(self, instance):
+        request = self.context['request']
+        tag_index = tag_registry.for_request(request)
+        viewer_state = (
+            ViewerState.for_request(request)
+            if request.user.is_authenticated else None
+        )
+        return {
+            'id': instance.pk,
+            'cooking_time': instance.cooking_time,
+            'image': self.file_url(instance.image),
+            'image_variants': self.variant_urls(instance.image),
+            'ingredients': [
+                {
+                    'id': item.ingredient.pk,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in instance.ingredient_in_recipes.all()
+            ],
+            'tags': tag_index.serialize(
+                tag.pk for tag in instance.tags.all()
+            ),
+            'is_favorited': (
+                viewer_state is not None
+                and viewer_state.is_favorited(instance.pk)
+            ),
+            'is_in_shopping_cart': (
+                viewer_state is not None
+                and viewer_state.is_in_shopping_cart(instance.pk)
+            ),
+            'name': instance.name,
+            'text': instance.text,
+            'author': self.author_representation(
+                instance.author, viewer_state
+            ),
+        }
+
+
 class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
     """
     Сериализатор для работы с избранными рецептами и корзиной.
     """
 
+    image_variants = ImageVariantsField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class BatchActionSerializer(serializers.Serializer):
+    """
+    Список идентификаторов для пакетного добавления или удаления.
+    """
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_ACTION_MAX_SIZE
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
 
 
 class IngredientSerializer(serializers.ModelSerializer):
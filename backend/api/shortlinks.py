@@ -0,0 +1,63 @@
+import re
+from functools import lru_cache
+
+import hashids
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Recipe
+
+SHORT_LINK_PATH = re.compile(r'^/s/(?P<short_code>[^/]+)/?$')
+CACHE_KEY = 'short_link:{}'
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    return hashids.Hashids(
+        salt=settings.SHORT_LINK_SALT,
+        min_length=settings.SHORT_LINK_MIN_LENGTH
+    )
+
+
+def make_short_code(recipe_id):
+    return get_encoder().encode(recipe_id)
+
+
+def get_short_code(recipe):
+    """
+    Возвращает сохранённый код рецепта, создавая его при первом обращении.
+    """
+    if not recipe.short_code:
+        recipe.short_code = make_short_code(recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            short_code=recipe.short_code
+        )
+    return recipe.short_code
+
+
+def get_recipe_path(recipe_id):
+    return f'/recipes/{recipe_id}/'
+
+
+def resolve_short_code(short_code):
+    """
+    Возвращает путь рецепта по короткому коду или None.
+
+    Найденные коды кэшируются, поэтому повторные переходы
+    по ссылке не обращаются к базе данных.
+    """
+    cache_key = CACHE_KEY.format(short_code)
+    path = cache.get(cache_key)
+    if path is None:
+        recipe_id = Recipe.objects.filter(
+            short_code=short_code
+        ).values_list('id', flat=True).first()
+        if recipe_id is None:
+            return None
+        path = get_recipe_path(recipe_id)
+        cache.set(cache_key, path, settings.SHORT_LINK_CACHE_TIMEOUT)
+    return path
+
+
+def forget_short_code(short_code):
+    cache.delete(CACHE_KEY.format(short_code))
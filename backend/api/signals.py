@@ -0,0 +1,248 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api.caching import (RECIPES_VERSION, USER_PROFILES_VERSION,
+                         bump_version, tag_registry)
+from api.images import generate_variants_safely, release_image_on_commit
+from api.search import ingredient_index, update_recipe_search_vector
+from api.shortlinks import forget_short_code
+from api.viewer_state import ViewerState
+from recipes.models import (CustomUser,
+                            Favorite,
+                            Ingredient,
+                            IngredientInRecipe,
+                            Recipe,
+                            ShoppingCart,
+                            ShoppingListItem,
+                            Subscription,
+                            Tag,
+                            change_counters,
+                            sync_ingredient_ids)
+
+# Поля пользователя, которые выводятся в ответах с рецептами.
+PROFILE_FIELDS = ('email', 'username', 'first_name', 'last_name', 'avatar')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Ingredient)
+def sync_recipes_without_ingredient(sender, instance, **kwargs):
+    sync_ingredient_ids(
+        Recipe.objects.filter(ingredient_ids__contains=[instance.pk])
+    )
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_registry(sender, **kwargs):
+    tag_registry.invalidate()
+
+
+@receiver(post_delete, sender=Tag)
+def clear_tag_bit(sender, instance, **kwargs):
+    """
+    Снимает бит удалённого тега с масок рецептов, чтобы его можно было
+    выдать новому тегу.
+    """
+    Recipe.objects.alias(
+        tag_bits=F('tags_mask').bitand(instance.mask)
+    ).exclude(tag_bits=0).update(
+        tags_mask=F('tags_mask').bitand(~instance.mask)
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(RECIPES_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def bump_viewer_state_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ViewerState.bump(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_search_vector(sender, instance, update_fields=None,
+                                 **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    update_recipe_search_vector(Recipe.objects.filter(pk=instance.pk))
+
+
+def image_changed(instance, field_name, update_fields):
+    """
+    Меняется ли изображение при этом сохранении: объект создаётся,
+    загружен новый файл или имя файла отличается от загруженного
+    из базы (см. LoadedImagesMixin).
+    """
+    if update_fields is not None and field_name not in update_fields:
+        return False
+    field_file = getattr(instance, field_name)
+    if instance._state.adding or not field_file._committed:
+        return True
+    loaded = getattr(instance, '_loaded_images', {})
+    if field_name not in loaded:
+        loaded[field_name] = type(instance)._default_manager.filter(
+            pk=instance.pk
+        ).values_list(field_name, flat=True).first()
+    return field_file.name != loaded[field_name]
+
+
+def build_image_variants(instance, field_name, changed):
+    """
+    Строит варианты изображения после фиксации транзакции,
+    только если изображение изменилось.
+    """
+    field_file = getattr(instance, field_name)
+    instance._loaded_images = {
+        **getattr(instance, '_loaded_images', {}),
+        field_name: field_file.name,
+    }
+    if changed and field_file:
+        transaction.on_commit(lambda: generate_variants_safely(field_file))
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, update_fields=None, **kwargs):
+    instance._image_changed = image_changed(instance, 'image', update_fields)
+
+
+@receiver(post_save, sender=Recipe)
+def build_recipe_image_variants(sender, instance, **kwargs):
+    build_image_variants(instance, 'image', instance._image_changed)
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_avatar(sender, instance, update_fields=None, **kwargs):
+    instance._avatar_changed = image_changed(
+        instance, 'avatar', update_fields
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+def build_avatar_variants(sender, instance, **kwargs):
+    build_image_variants(instance, 'avatar', instance._avatar_changed)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты удаляемого рецепта из списков покупок всех
+    пользователей, у которых он лежит в корзине, до каскадного
+    удаления корзин: через API, админку или вместе с автором.
+    """
+    ShoppingListItem.objects.change_recipe(
+        instance, ShoppingListItem.objects.recipe_amounts(instance), {}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe(sender, instance, created, **kwargs):
+    """
+    Счётчик рецептов автора растёт при создании рецепта через API
+    или админку и уменьшается при удалении в release_recipe_counters.
+    """
+    if created:
+        change_counters(
+            CustomUser.objects.filter(pk=instance.author_id),
+            recipes_count=1
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_recipe_counters(sender, instance, **kwargs):
+    change_counters(
+        CustomUser.objects.filter(pk=instance.author_id), recipes_count=-1
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe_short_code(sender, instance, **kwargs):
+    if instance.short_code:
+        forget_short_code(instance.short_code)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    release_image_on_commit(Recipe, 'image', instance.image.name)
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_avatar(sender, instance, **kwargs):
+    release_image_on_commit(CustomUser, 'avatar', instance.avatar.name)
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_profile_fields(sender, instance, update_fields=None, **kwargs):
+    """
+    Запоминает выводимые поля профиля до сохранения, чтобы после
+    сохранения сравнить их с новыми значениями.
+    """
+    instance._saved_profile = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(PROFILE_FIELDS) & set(
+        update_fields
+    ):
+        return
+    instance._saved_profile = CustomUser.objects.filter(
+        pk=instance.pk
+    ).values(*PROFILE_FIELDS).first()
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_user_profiles_version(sender, instance, created, **kwargs):
+    """
+    Версия профилей входит в ключи кэша и ETag всех ответов
+    с рецептами, поэтому меняется только при изменении выводимых
+    в них полей, а не при регистрации, входе или смене пароля.
+    """
+    saved = getattr(instance, '_saved_profile', None)
+    if created or saved is None:
+        return
+    current = {
+        field: instance._meta.get_field(field).get_prep_value(
+            getattr(instance, field)
+        )
+        for field in PROFILE_FIELDS
+    }
+    if current != saved:
+        bump_version(USER_PROFILES_VERSION)
+
+
+@receiver(post_delete, sender=CustomUser)
+def bump_user_profiles_version_on_delete(sender, **kwargs):
+    bump_version(USER_PROFILES_VERSION)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_user_counters(sender, instance, **kwargs):
+    """
+    Уменьшает счётчики рецептов и авторов, связанных с удаляемым
+    пользователем, до каскадного удаления его избранного,
+    корзины и подписок.
+    """
+    change_counters(
+        Recipe.objects.filter(favorited_by__user=instance),
+        favorites_count=-1
+    )
+    change_counters(
+        Recipe.objects.filter(in_shopping_cart__user=instance),
+        in_carts_count=-1
+    )
+    change_counters(
+        CustomUser.objects.filter(subscribers__user=instance),
+        subscribers_count=-1
+    )
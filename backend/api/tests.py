@@ -0,0 +1,1032 @@
+import base64
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from decimal import Decimal
+from unittest import mock, skipIf
+from urllib.parse import quote
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.caching import RECIPES_VERSION, USER_PROFILES_VERSION, bump_version
+from api.management.commands.load_ingredients import (
+    Command as LoadIngredientsCommand)
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.response_cache import response_cache
+from api.serializers import RecipeReadSerializer, RecipeSerializer
+from api.views import RecipeViewSet
+from recipes.models import (CustomUser,
+                            Favorite,
+                            FeedEntry,
+                            Ingredient,
+                            Recipe,
+                            ShoppingCart,
+                            ShoppingListItem,
+                            Subscription,
+                            Tag)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+# Число запросов в тестах считается без обращений к кэшу в базе.
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+def make_image():
+    output = io.BytesIO()
+    Image.new('RGB', (32, 32), (214, 140, 69)).save(output, 'PNG')
+    encoded = base64.b64encode(output.getvalue()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+
+def make_user(name):
+    return CustomUser.objects.create_user(
+        email=f'{name}@example.com',
+        username=name,
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password-12345'
+    )
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, ALLOWED_HOSTS=['testserver'], CACHES=LOCAL_CACHES
+)
+class BaseAPITestCase(APITestCase):
+    """
+    Общие данные для тестов API: авторы, читатель, теги и ингредиенты.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [make_user(f'author{number}') for number in range(5)]
+        cls.reader = make_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Кэш ответов живёт в процессе и не откатывается вместе с базой.
+        response_cache.clear()
+
+    def payload(self, size=1, **fields):
+        self.recipe_number = getattr(self, 'recipe_number', 0) + 1
+        return {
+            'name': f'Рецепт {self.recipe_number}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': [tag.pk for tag in self.tags[:size]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:size * 3]
+            ],
+            **fields,
+        }
+
+    def assertCountersConsistent(self):
+        output = io.StringIO()
+        call_command('reconcile_counters', '--check', stdout=output)
+        self.assertIn('Счётчики согласованы', output.getvalue())
+
+    def assertShoppingListConsistent(self):
+        self.assertEqual(
+            ShoppingListItem.objects.expected_amounts(),
+            {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in
+                ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                )
+            }
+        )
+
+    def create_recipe(self, author, size=1, **fields):
+        self.client.force_authenticate(author)
+        response = self.client.post(
+            '/api/recipes/', self.payload(size, **fields), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+
+class CacheSettingsTests(SimpleTestCase):
+
+    @override_settings(CACHES=LOCAL_CACHES, WEB_CONCURRENCY=2)
+    def test_local_cache_with_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apps.get_app_config('api').ready()
+
+    @override_settings(CACHES=LOCAL_CACHES, WEB_CONCURRENCY=1)
+    def test_local_cache_single_worker(self):
+        apps.get_app_config('api').ready()
+
+
+@skipIf(orjson is None, 'orjson не установлен')
+@override_settings(API_JSON_BACKEND='orjson')
+class FastJSONTests(SimpleTestCase):
+    """
+    Быстрые рендерер и парсер дают тот же результат, что и JSONRenderer
+    и JSONParser DRF, включая ошибки.
+    """
+
+    def render(self, renderer_class, data, strict=True):
+        renderer = renderer_class()
+        renderer.strict = strict
+        try:
+            return renderer.render(data)
+        except ValueError as exc:
+            return ValueError, str(exc)
+
+    def parse(self, parser_class, body):
+        try:
+            return parser_class().parse(io.BytesIO(body))
+        except ParseError as exc:
+            return ParseError, str(exc.detail)
+
+    def test_renderer(self):
+        for data in (
+            {'text': 'Борщ \u2028 «с»\n\u2029', 'empty': None},
+            [True, False, 0, -1, 2 ** 63, 2 ** 70, -2 ** 80, (1, 2)],
+            {'at': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456,
+                                     tzinfo=datetime.timezone.utc),
+             'day': datetime.date(2024, 5, 1),
+             'time': datetime.time(7, 5),
+             'uuid': uuid.UUID(int=1),
+             'lazy': gettext_lazy('Рецепт')},
+            [0.1, 1.5, -0.0, 1e-7, 1e22, 1e16, Decimal('1.10')],
+            {1: 'один', 'nested': [{'a': [{'b': [0.5]}]}]},
+            float('nan'), [float('inf')], {'a': {'b': -float('inf')}},
+            None,
+        ):
+            for strict in (True, False):
+                self.assertEqual(
+                    self.render(FastJSONRenderer, data, strict),
+                    self.render(JSONRenderer, data, strict),
+                    data
+                )
+        self.assertEqual(
+            self.render(FastJSONRenderer, [float('nan')])[0], ValueError
+        )
+
+    def test_parser(self):
+        for body in (
+            '{"name": "Борщ", "tags": [1, 2], "image": null}'.encode(),
+            b'{"id": 123456789012345678901234567890}',
+            b'{"amount": 1.5, "small": 1e-7}',
+            b'{"big": 1e400}',
+            b'{"a": NaN}',
+            b'[Infinity]',
+            b'{"a": 1,}',
+            b'{"a": "\\ud800"}',
+            b'\xff',
+            b'',
+        ):
+            self.assertEqual(
+                self.parse(FastJSONParser, body),
+                self.parse(JSONParser, body),
+                body
+            )
+
+
+class TagBitTests(TransactionTestCase):
+    """
+    Теги, создаваемые параллельно, получают разные биты маски.
+    """
+
+    def create_tag(self, name, created=None, release=None):
+        try:
+            with transaction.atomic():
+                Tag.objects.create(name=name, slug=name)
+                if created is not None:
+                    created.set()
+                    release.wait(5)
+        finally:
+            connection.close()
+
+    def test_concurrent_create(self):
+        created, release = threading.Event(), threading.Event()
+        first = threading.Thread(
+            target=self.create_tag, args=('first', created, release)
+        )
+        first.start()
+        self.assertTrue(created.wait(5))
+        # Второй тег ждёт фиксации первого и берёт следующий бит.
+        second = threading.Thread(target=self.create_tag, args=('second',))
+        second.start()
+        second.join(0.5)
+        self.assertTrue(second.is_alive())
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(
+            sorted(Tag.objects.values_list('bit', flat=True)), [0, 1]
+        )
+
+
+class RecipeQueryCountTests(BaseAPITestCase):
+    """
+    Число запросов к базе для чтения и записи рецептов закреплено
+    и не зависит от количества рецептов на странице, тегов
+    и ингредиентов.
+    """
+
+    def request(self, method, path, size=None, **fields):
+        data = None if size is None else self.payload(size, **fields)
+        return getattr(self.client, method)(path, data, format='json')
+
+    def assertQueries(self, count, user, method, path, size=None,
+                      status=200, cached=False, **fields):
+        self.client.force_authenticate(user)
+        # Первый запрос не замеряется: он заполняет кэши,
+        # которые строятся при первом обращении.
+        self.request(method, path, size, **fields)
+        if not cached:
+            response_cache.clear()
+        with self.assertNumQueries(count):
+            response = self.request(method, path, size, **fields)
+        self.assertEqual(response.status_code, status, response.data)
+
+    def test_list(self):
+        self.create_recipe(self.authors[0])
+        self.assertQueries(4, None, 'get', '/api/recipes/')
+        for author in self.authors:
+            self.create_recipe(author, size=3)
+        self.assertQueries(4, None, 'get', '/api/recipes/')
+
+    def test_list_authenticated(self):
+        self.create_recipe(self.authors[0])
+        self.assertQueries(7, self.reader, 'get', '/api/recipes/')
+        for author in self.authors:
+            recipe = self.create_recipe(author, size=3)
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/users/{self.authors[1].pk}/subscribe/')
+        self.client.post(f'/api/recipes/{recipe}/favorite/')
+        self.client.post(f'/api/recipes/{recipe}/shopping_cart/')
+        self.assertQueries(7, self.reader, 'get', '/api/recipes/')
+
+    def test_retrieve(self):
+        small = self.create_recipe(self.authors[0])
+        large = self.create_recipe(self.authors[1], size=3)
+        self.assertQueries(4, None, 'get', f'/api/recipes/{small}/')
+        self.assertQueries(4, None, 'get', f'/api/recipes/{large}/')
+
+    def test_cached(self):
+        recipe = self.create_recipe(self.authors[0])
+        self.assertQueries(0, None, 'get', '/api/recipes/', cached=True)
+        self.assertQueries(
+            1, None, 'get', f'/api/recipes/{recipe}/', cached=True
+        )
+
+    def test_create(self):
+        for size in (1, 3):
+            self.assertQueries(
+                23, self.authors[0], 'post', '/api/recipes/', size, status=201
+            )
+
+    def test_update(self):
+        path = f'/api/recipes/{self.create_recipe(self.authors[0])}/'
+        for size in (1, 3):
+            self.assertQueries(21, self.authors[0], 'patch', path, size)
+
+
+class ResponseCacheTests(BaseAPITestCase):
+    """
+    Записи кэша ответов перестают читаться, как только другой процесс
+    меняет данные и версию в общем кэше.
+    """
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertRefreshed(self, path, change, version=None):
+        self.client.force_authenticate(None)
+        self.get(path)
+        self.assertEqual(self.get(path)['X-Cache'], 'HIT')
+        # Изменение без сигналов этого процесса: данные и версию
+        # меняет другой процесс.
+        change()
+        if version is not None:
+            bump_version(version)
+        response = self.get(path)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return response.data
+
+    def test_list(self):
+        recipe = self.create_recipe(self.authors[0])
+        data = self.assertRefreshed(
+            '/api/recipes/',
+            lambda: Recipe.objects.filter(pk=recipe).update(name='Новое'),
+            RECIPES_VERSION
+        )
+        self.assertEqual(data['results'][0]['name'], 'Новое')
+
+    def test_retrieve(self):
+        recipe = self.create_recipe(self.authors[0])
+        data = self.assertRefreshed(
+            f'/api/recipes/{recipe}/',
+            lambda: Recipe.objects.filter(pk=recipe).update(
+                name='Новое', updated_at=timezone.now()
+            )
+        )
+        self.assertEqual(data['name'], 'Новое')
+
+    def test_author_profile(self):
+        recipe = self.create_recipe(self.authors[0])
+        data = self.assertRefreshed(
+            f'/api/recipes/{recipe}/',
+            lambda: CustomUser.objects.filter(
+                pk=self.authors[0].pk
+            ).update(first_name='Новое'),
+            USER_PROFILES_VERSION
+        )
+        self.assertEqual(data['author']['first_name'], 'Новое')
+
+
+class FeedTests(BaseAPITestCase):
+    """
+    Лента содержит рецепты только тех авторов, на которых
+    пользователь подписан сейчас.
+    """
+
+    def feed(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def subscribe(self, method, *authors):
+        self.client.force_authenticate(self.reader)
+        if len(authors) == 1:
+            return self.client.generic(
+                method, f'/api/users/{authors[0].pk}/subscribe/'
+            )
+        return self.client.generic(
+            method, '/api/users/subscribe/',
+            json.dumps({'ids': [author.pk for author in authors]}),
+            content_type='application/json'
+        )
+
+    def check_unsubscribe(self):
+        before = {
+            author.pk: self.create_recipe(author)
+            for author in self.authors[:3]
+        }
+        self.subscribe('POST', self.authors[0])
+        self.subscribe('POST', *self.authors[1:3])
+        after = {
+            author.pk: self.create_recipe(author)
+            for author in self.authors[:3]
+        }
+        self.assertEqual(
+            self.feed(), set(before.values()) | set(after.values())
+        )
+
+        self.subscribe('DELETE', self.authors[0])
+        self.assertEqual(
+            self.feed(),
+            {recipes[author.pk]
+             for recipes in (before, after) for author in self.authors[1:3]}
+        )
+        self.subscribe('DELETE', *self.authors[1:3])
+        self.assertEqual(self.feed(), set())
+
+    def test_unsubscribe_empties_feed(self):
+        self.check_unsubscribe()
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_unsubscribe_empties_feed_without_fan_out(self):
+        self.check_unsubscribe()
+
+
+class BatchActionTests(BaseAPITestCase):
+    """
+    Пакетные операции возвращают результат для каждого идентификатора
+    и меняют счётчики только для действительно вставленных
+    или удалённых строк.
+    """
+
+    missing = 10 ** 9
+
+    def batch(self, method, path, ids):
+        self.client.force_authenticate(self.reader)
+        response = self.client.generic(
+            method, path, json.dumps({'ids': ids}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (result['id'], result['status'])
+            for result in response.data['results']
+        ]
+
+    def check_recipes(self, model, path, counter_field):
+        first, second, third = (
+            self.create_recipe(author) for author in self.authors[:3]
+        )
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/recipes/{first}/{path}/')
+
+        self.assertEqual(
+            self.batch('POST', f'/api/recipes/{path}/',
+                       [first, second, self.missing, second]),
+            [(first, 'exists'), (second, 'created'),
+             (self.missing, 'not_found')]
+        )
+        self.assertEqual(
+            self.batch('DELETE', f'/api/recipes/{path}/',
+                       [second, third, self.missing]),
+            [(second, 'deleted'), (third, 'absent'),
+             (self.missing, 'not_found')]
+        )
+        self.assertEqual(
+            self.batch('DELETE', f'/api/recipes/{path}/', [second]),
+            [(second, 'absent')]
+        )
+        self.assertEqual(
+            dict(Recipe.objects.filter(
+                pk__in=(first, second, third)
+            ).values_list('pk', counter_field)),
+            {first: 1, second: 0, third: 0}
+        )
+        self.assertEqual(
+            set(model.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', flat=True)),
+            {first}
+        )
+        self.assertCountersConsistent()
+        self.assertShoppingListConsistent()
+
+    def test_favorite(self):
+        self.check_recipes(Favorite, 'favorite', 'favorites_count')
+
+    def test_shopping_cart(self):
+        self.check_recipes(ShoppingCart, 'shopping_cart', 'in_carts_count')
+
+    def test_subscribe(self):
+        first, second, third = self.authors[:3]
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/users/{first.pk}/subscribe/')
+
+        self.assertEqual(
+            self.batch('POST', '/api/users/subscribe/',
+                       [first.pk, second.pk, self.reader.pk, self.missing]),
+            [(first.pk, 'exists'), (second.pk, 'created'),
+             (self.reader.pk, 'self'), (self.missing, 'not_found')]
+        )
+        self.assertEqual(
+            self.batch('DELETE', '/api/users/subscribe/',
+                       [second.pk, third.pk, self.reader.pk, self.missing]),
+            [(second.pk, 'deleted'), (third.pk, 'absent'),
+             (self.reader.pk, 'self'), (self.missing, 'not_found')]
+        )
+        self.assertEqual(
+            dict(CustomUser.objects.filter(
+                pk__in=(first.pk, second.pk, third.pk, self.reader.pk)
+            ).values_list('pk', 'subscribers_count')),
+            {first.pk: 1, second.pk: 0, third.pk: 0, self.reader.pk: 0}
+        )
+        self.assertCountersConsistent()
+
+
+class RecipeReadSerializerTests(BaseAPITestCase):
+    """
+    RecipeReadSerializer выдаёт тот же JSON, что и RecipeSerializer.
+    """
+
+    def render(self, serializer_class, user, recipes, many=True):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        serializer = serializer_class(
+            recipes if many else recipes[0],
+            many=many, context={'request': request}
+        )
+        return json.dumps(serializer.data, ensure_ascii=False)
+
+    def check_parity(self, user):
+        recipes = list(
+            RecipeViewSet.with_related(Recipe.objects.all())
+        )
+        for many in (True, False):
+            self.assertEqual(
+                self.render(RecipeSerializer, user, recipes, many),
+                self.render(RecipeReadSerializer, user, recipes, many)
+            )
+
+    def test_parity(self):
+        first = self.create_recipe(self.authors[0], size=3)
+        second = self.create_recipe(self.authors[1])
+        self.create_recipe(self.authors[2], size=2)
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/users/{self.authors[0].pk}/subscribe/')
+        self.client.post(f'/api/recipes/{first}/favorite/')
+        self.client.post(f'/api/recipes/{second}/shopping_cart/')
+
+        self.check_parity(AnonymousUser())
+        self.check_parity(CustomUser.objects.get(pk=self.reader.pk))
+
+
+class ShoppingListTests(BaseAPITestCase):
+    """
+    Сводный список покупок совпадает с пересчётом по корзинам после
+    добавления в корзину, правки и удаления рецепта и удаления
+    из корзины.
+    """
+
+    def assertShoppingList(self, user, amounts):
+        self.assertShoppingListConsistent()
+        ingredients = {
+            ingredient.pk: number
+            for number, ingredient in enumerate(self.ingredients)
+        }
+        self.assertEqual(
+            {
+                ingredients[ingredient_id]: amount
+                for ingredient_id, amount in ShoppingListItem.objects.filter(
+                    user=user
+                ).values_list('ingredient_id', 'amount')
+            },
+            amounts
+        )
+
+    def test_shopping_list(self):
+        first = self.create_recipe(self.authors[0])
+        second = self.create_recipe(self.authors[1])
+        self.client.force_authenticate(self.reader)
+        for recipe in (first, second):
+            self.client.post(f'/api/recipes/{recipe}/shopping_cart/')
+        self.client.force_authenticate(self.authors[2])
+        self.client.post(
+            '/api/recipes/shopping_cart/', {'ids': [first]}, format='json'
+        )
+        self.assertShoppingList(self.reader, {0: 20, 1: 20, 2: 20})
+
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.patch(f'/api/recipes/{first}/', {
+            'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 5},
+                {'id': self.ingredients[5].pk, 'amount': 7},
+            ],
+            'tags': [self.tags[0].pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertShoppingList(self.reader, {0: 15, 1: 10, 2: 10, 5: 7})
+        self.assertShoppingList(self.authors[2], {0: 5, 5: 7})
+
+        self.client.force_authenticate(self.authors[1])
+        response = self.client.delete(f'/api/recipes/{second}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertShoppingList(self.reader, {0: 5, 5: 7})
+
+        self.client.force_authenticate(self.reader)
+        response = self.client.delete(f'/api/recipes/{first}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assertShoppingList(self.reader, {})
+        self.assertShoppingList(self.authors[2], {0: 5, 5: 7})
+
+
+class ImageVariantsTests(BaseAPITestCase):
+    """
+    Варианты изображений строятся только при изменении изображения,
+    а не при каждом сохранении рецепта или пользователя.
+    """
+
+    def built(self, action):
+        with mock.patch('api.signals.generate_variants_safely') as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                action()
+        return [field_file.name for (field_file,), _ in build.call_args_list]
+
+    def patch(self, recipe, **fields):
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.patch(
+            f'/api/recipes/{recipe}/', self.payload(**fields), format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_recipe(self):
+        built = self.built(lambda: setattr(
+            self, 'recipe', self.create_recipe(self.authors[0])
+        ))
+        recipe = Recipe.objects.get(pk=self.recipe)
+        self.assertEqual(built, [recipe.image.name])
+
+        self.assertEqual(self.built(lambda: self.patch(recipe.pk)), [])
+        self.assertEqual(self.built(recipe.save), [])
+        self.assertEqual(
+            self.built(lambda: recipe.save(update_fields=['name'])), []
+        )
+
+        output = io.BytesIO()
+        Image.new('RGB', (16, 16), (1, 2, 3)).save(output, 'PNG')
+        image = base64.b64encode(output.getvalue()).decode('ascii')
+        built = self.built(lambda: self.patch(
+            recipe.pk, image=f'data:image/png;base64,{image}'
+        ))
+        recipe.refresh_from_db()
+        self.assertEqual(built, [recipe.image.name])
+
+        recipe.image = 'recipes/other.png'
+        self.assertEqual(self.built(recipe.save), ['recipes/other.png'])
+
+    def test_user(self):
+        user = CustomUser.objects.get(pk=self.reader.pk)
+        self.assertEqual(self.built(user.save), [])
+        self.assertEqual(
+            self.built(lambda: make_user('newcomer')), []
+        )
+
+        self.client.force_authenticate(self.reader)
+        built = self.built(lambda: self.assertEqual(self.client.put(
+            '/api/users/me/avatar/', {'avatar': make_image()}, format='json'
+        ).status_code, 200))
+        user.refresh_from_db()
+        self.assertEqual(built, [user.avatar.name])
+        self.assertEqual(self.built(user.save), [])
+        self.assertEqual(
+            self.built(lambda: user.save(update_fields=['last_login'])), []
+        )
+
+
+class CursorPaginationTests(BaseAPITestCase):
+    """
+    Курсорная пагинация проходит выборку вперёд и назад без пропусков
+    и повторов, в том числе при совпадающих ключах сортировки
+    и при слиянии нескольких источников ленты.
+    """
+
+    def get(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status, response.data)
+        return response.data
+
+    def walk(self, path, expected):
+        forward, url = [], f'{path}cursor=&limit=2'
+        while url:
+            data = self.get(url)
+            forward.append([recipe['id'] for recipe in data['results']])
+            url = data['next']
+        self.assertEqual(sum(forward, []), expected)
+
+        backward = [forward[-1]]
+        url = data['previous']
+        while url:
+            data = self.get(url)
+            backward.append([recipe['id'] for recipe in data['results']])
+            url = data['previous']
+        self.assertEqual(backward[::-1], forward)
+
+    def create_recipes(self, count, name=None, **fields):
+        return [
+            self.create_recipe(self.authors[number % 2], **fields, **(
+                {'name': f'{name} {number}'} if name else {}
+            ))
+            for number in range(count)
+        ]
+
+    def test_round_trip(self):
+        self.create_recipes(7)
+        self.client.force_authenticate(None)
+        self.walk('/api/recipes/?', list(
+            Recipe.objects.order_by('-created_at', '-id').values_list(
+                'id', flat=True
+            )
+        ))
+
+    def test_equal_created_at(self):
+        recipes = self.create_recipes(5)
+        Recipe.objects.update(created_at=timezone.now())
+        self.client.force_authenticate(None)
+        self.walk('/api/recipes/?', sorted(recipes, reverse=True))
+
+    def test_equal_search_rank(self):
+        recipes = self.create_recipes(5, name='Борщ', text='Борщ')
+        self.create_recipe(self.authors[2], name='Каша', text='Каша')
+        self.client.force_authenticate(None)
+        self.walk(
+            f'/api/recipes/?search={quote("борщ")}&',
+            sorted(recipes, reverse=True)
+        )
+
+    def test_malformed_cursor(self):
+        self.create_recipes(3)
+        self.client.force_authenticate(None)
+        for cursor in (
+            'не-курсор',
+            'e30',
+            base64.urlsafe_b64encode(b'{"v":[1]}').decode(),
+            base64.urlsafe_b64encode(b'{"v":["x","y"]}').decode(),
+            base64.urlsafe_b64encode(b'[1,2]').decode(),
+        ):
+            self.get(f'/api/recipes/?cursor={cursor}', status=404)
+
+    def test_feed_sources(self):
+        self.client.force_authenticate(self.reader)
+        for author in self.authors[:2]:
+            self.client.post(f'/api/users/{author.pk}/subscribe/')
+            # Автор рецепта берётся из запроса, а не из базы.
+            author.refresh_from_db()
+        recipes = []
+        for number in range(3):
+            recipes.append(self.create_recipe(self.authors[0]))
+            with override_settings(FEED_FANOUT_LIMIT=0):
+                recipes.append(self.create_recipe(self.authors[1]))
+        self.create_recipe(self.authors[2])
+        self.assertEqual(
+            Recipe.objects.filter(fanned_out=False).count(), 3
+        )
+
+        self.client.force_authenticate(self.reader)
+        self.walk('/api/recipes/feed/?', recipes[::-1])
+
+        moment = timezone.now()
+        Recipe.objects.update(created_at=moment)
+        FeedEntry.objects.update(created_at=moment)
+        self.walk('/api/recipes/feed/?', sorted(recipes, reverse=True))
+
+
+class RecipeFilterTests(BaseAPITestCase):
+    """
+    Фильтры списка рецептов: поиск, ингредиенты и теги.
+    """
+
+    def ids(self, query):
+        self.client.force_authenticate(None)
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def search(self, query):
+        return self.ids(f'search={quote(query)}')
+
+    def test_search(self):
+        in_name = self.create_recipe(
+            self.authors[0], name='Борщ украинский', text='Со свёклой'
+        )
+        in_text = self.create_recipe(
+            self.authors[1], name='Суп дня', text='Почти борщ, но без мяса'
+        )
+        other = self.create_recipe(
+            self.authors[2], name='Каша', text='Овсяная на молоке'
+        )
+
+        # Совпадение в названии весит больше, чем в описании,
+        # хотя более новый рецепт без ранга шёл бы первым.
+        self.assertEqual(self.search('борщ'), [in_name, in_text])
+        self.assertEqual(self.search('борща'), [in_name, in_text])
+        self.assertEqual(self.search('борщ -украинский'), [in_text])
+        self.assertEqual(self.search('"борщ украинский"'), [in_name])
+        self.assertEqual(self.search('каша or суп'), [other, in_text])
+        self.assertEqual(self.search('пицца'), [])
+        self.assertEqual(self.search('  '), [other, in_text, in_name])
+
+    def create_with(self, author, ingredients=(), tags=()):
+        return self.create_recipe(
+            author,
+            ingredients=[
+                {'id': self.ingredients[number].pk, 'amount': 10}
+                for number in ingredients
+            ],
+            tags=[self.tags[number].pk for number in tags] or [
+                self.tags[0].pk
+            ]
+        )
+
+    def pks(self, *numbers):
+        return ','.join(str(self.ingredients[number].pk) for number in numbers)
+
+    def test_ingredients(self):
+        first = self.create_with(self.authors[0], ingredients=(0, 1))
+        second = self.create_with(self.authors[1], ingredients=(0, 1, 2))
+        third = self.create_with(self.authors[2], ingredients=(2, 3))
+
+        query = f'ingredients={self.pks(0, 1)}'
+        self.assertEqual(self.ids(query), [second, first])
+        self.assertEqual(
+            self.ids(f'{query}&ingredients_match=all'), [second, first]
+        )
+        self.assertEqual(self.ids(f'{query}&ingredients_match=only'), [first])
+        self.assertEqual(
+            self.ids(f'ingredients={self.pks(1, 3)}&ingredients_match=any'),
+            [third, second, first]
+        )
+        self.assertEqual(
+            self.ids(f'ingredients={self.pks(0, 1, 2, 3)}'
+                     '&ingredients_match=only'),
+            [third, second, first]
+        )
+        self.assertEqual(
+            self.ids(f'exclude_ingredients={self.pks(2)}'), [first]
+        )
+        self.assertEqual(
+            self.ids(f'exclude_ingredients={self.pks(4)}'),
+            [third, second, first]
+        )
+        self.assertEqual(
+            self.ids(f'{query}&exclude_ingredients={self.pks(2)}'), [first]
+        )
+        self.assertEqual(self.ids(f'ingredients={self.pks(4)}'), [])
+
+        # Массив ingredient_ids обновляется при правке рецепта.
+        self.client.force_authenticate(self.authors[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/recipes/{first}/', {
+                'ingredients': [{'id': self.ingredients[4].pk, 'amount': 5}],
+                'tags': [self.tags[0].pk],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.ids(query), [second])
+        self.assertEqual(self.ids(f'ingredients={self.pks(4)}'), [first])
+
+    def test_tags(self):
+        first = self.create_with(self.authors[0], (0,), tags=(0, 1))
+        second = self.create_with(self.authors[1], (0,), tags=(1, 2))
+        third = self.create_with(self.authors[2], (0,), tags=(2,))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Тег 3', slug='tag3')
+
+        # Рецепт с несколькими подходящими тегами выдаётся один раз.
+        self.assertEqual(self.ids('tags=tag0&tags=tag1'), [second, first])
+        self.assertEqual(
+            self.ids('tags=tag0&tags=tag1&tags_match=any'), [second, first]
+        )
+        self.assertEqual(
+            self.ids('tags=tag0&tags=tag1&tags_match=all'), [first]
+        )
+        self.assertEqual(
+            self.ids('tags=tag1&tags=tag2&tags_match=all'), [second]
+        )
+        self.assertEqual(self.ids('tags=tag2'), [third, second])
+        self.assertEqual(self.ids('tags=tag3'), [])
+
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.status_code, 400)
+
+
+class LoadIngredientsTests(BaseAPITestCase):
+    """
+    load_ingredients считает только действительно добавленные строки.
+    """
+
+    def test_counts(self):
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ingredients.csv')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('Ингредиент 0,г\nСоль,г\nСоль,г\n Перец , г \n')
+            call_command('load_ingredients', path, stdout=output)
+        self.assertIn(
+            'прочитано 4, добавлено 2, пропущено 2', output.getvalue()
+        )
+        self.assertTrue(
+            Ingredient.objects.filter(name='Перец', measurement_unit='г')
+        )
+
+    def test_concurrent_insert(self):
+        def rows():
+            yield 'Соль', 'г'
+            # Другой процесс добавляет строку после того, как команда
+            # прочитала существующие ингредиенты.
+            Ingredient.objects.create(name='Перец', measurement_unit='г')
+            yield 'Перец', 'г'
+
+        command = LoadIngredientsCommand(stdout=io.StringIO())
+        self.assertEqual(command.load(rows(), batch_size=10), (2, 1))
+
+
+class AdminRelationTests(BaseAPITestCase):
+    """
+    Рецепты, избранное, корзина и подписки, изменённые в админке,
+    поддерживают счётчики так же, как API.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            password='password-12345'
+        )
+        self.client.force_login(self.admin)
+        self.recipes = [
+            self.create_recipe(author) for author in self.authors[:3]
+        ]
+
+    def admin_url(self, model, suffix=''):
+        return f'/admin/recipes/{model._meta.model_name}/{suffix}'
+
+    def add(self, model, **data):
+        response = self.client.post(self.admin_url(model, 'add/'), data)
+        self.assertEqual(response.status_code, 302)
+
+    def delete_selected(self, model, queryset):
+        response = self.client.post(self.admin_url(model), {
+            'action': 'delete_selected',
+            '_selected_action': list(queryset.values_list('pk', flat=True)),
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_recipe_counters(self):
+        recipe = Recipe.objects.create(
+            author=self.authors[4], name='Из админки', text='Описание',
+            cooking_time=5, image='recipes/admin.png'
+        )
+        self.assertCountersConsistent()
+        recipe.delete()
+        self.assertCountersConsistent()
+
+    def test_relation_counters(self):
+        for model in (Favorite, ShoppingCart):
+            for recipe in self.recipes:
+                self.add(model, user=self.reader.pk, recipe=recipe)
+            self.add(model, user=self.authors[0].pk, recipe=self.recipes[0])
+        for author in self.authors[:2]:
+            self.add(Subscription, user=self.reader.pk, author=author.pk)
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipes[0]).favorites_count, 2
+        )
+        self.assertCountersConsistent()
+
+        cart = ShoppingCart.objects.filter(user=self.reader).first()
+        response = self.client.post(
+            self.admin_url(ShoppingCart, f'{cart.pk}/delete/'),
+            {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        for model in (Favorite, ShoppingCart, Subscription):
+            self.delete_selected(model, model.objects.filter(user=self.reader))
+        self.assertCountersConsistent()
+        self.assertShoppingListConsistent()
+
+    def test_subscription_feed(self):
+        self.add(Subscription, user=self.reader.pk, author=self.authors[0].pk)
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0]]
+        )
+
+        self.delete_selected(
+            Subscription, Subscription.objects.filter(user=self.reader)
+        )
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_viewer_state_etag(self):
+        # Админка работает через сессию, API — от имени читателя.
+        self.client.force_authenticate(self.reader)
+        etag = self.client.get('/api/recipes/')['ETag']
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        for model in (Favorite, ShoppingCart):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add(model, user=self.reader.pk, recipe=self.recipes[0])
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+        recipe = next(
+            recipe for recipe in response.data['results']
+            if recipe['id'] == self.recipes[0]
+        )
+        self.assertTrue(recipe['is_favorited'])
+        self.assertTrue(recipe['is_in_shopping_cart'])
@@ -0,0 +1,113 @@
+from api.caching import bump_version, get_version
+from recipes.models import Favorite, ShoppingCart, Subscription
+
+
+class ViewerState:
+    """
+    Состояние текущего пользователя по отношению к объектам ответа:
+    подписки на авторов, избранное и корзина.
+
+    Создаётся один раз на запрос и загружает флаги пачками только
+    для тех объектов, которые попали на страницу.
+    """
+
+    version_key = 'viewer_state_version:{}'
+
+    def __init__(self, user):
+        self.user = user
+        self._subscribed = {}
+        self._favorited = {}
+        self._in_shopping_cart = {}
+
+    @classmethod
+    def get_version(cls, user):
+        """
+        Версия состояния пользователя для условных запросов:
+        меняется при любом изменении подписок, избранного или корзины.
+        """
+        if not user.is_authenticated:
+            return 'anonymous'
+        return get_version(cls.version_key.format(user.pk))
+
+    @classmethod
+    def bump(cls, user_id):
+        """
+        Меняет версию состояния пользователя. Вызывается сигналами
+        избранного, корзины и подписок, поэтому учитывает изменения
+        из API, админки и каскадных удалений.
+        """
+        bump_version(cls.version_key.format(user_id))
+
+    def touch(self):
+        """
+        Меняет версию после пакетных операций: они пишут в базу
+        одним SQL-запросом, минуя сигналы моделей.
+        """
+        if self.user.is_authenticated:
+            self.bump(self.user.pk)
+
+    @classmethod
+    def for_request(cls, request):
+        state = getattr(request, '_viewer_state', None)
+        if state is None:
+            state = cls(request.user)
+            request._viewer_state = state
+        return state
+
+    def _load(self, known, model, field, ids):
+        missing = {pk for pk in ids if pk not in known}
+        if not missing:
+            return
+        if self.user.is_authenticated:
+            found = set(
+                model.objects.filter(
+                    user=self.user, **{f'{field}__in': missing}
+                ).values_list(field, flat=True)
+            )
+        else:
+            found = set()
+        for pk in missing:
+            known[pk] = pk in found
+
+    def prime_authors(self, author_ids):
+        self._load(self._subscribed, Subscription, 'author_id', author_ids)
+
+    def prime_recipes(self, recipes):
+        recipe_ids = [recipe.pk for recipe in recipes]
+        self._load(self._favorited, Favorite, 'recipe_id', recipe_ids)
+        self._load(
+            self._in_shopping_cart, ShoppingCart, 'recipe_id', recipe_ids
+        )
+        self.prime_authors(recipe.author_id for recipe in recipes)
+
+    def is_subscribed(self, author_id):
+        self.prime_authors((author_id,))
+        return self._subscribed[author_id]
+
+    def is_favorited(self, recipe_id):
+        self._load(self._favorited, Favorite, 'recipe_id', (recipe_id,))
+        return self._favorited[recipe_id]
+
+    def is_in_shopping_cart(self, recipe_id):
+        self._load(
+            self._in_shopping_cart, ShoppingCart, 'recipe_id', (recipe_id,)
+        )
+        return self._in_shopping_cart[recipe_id]
+
+    def set_subscribed(self, author_id, value):
+        self.set_subscriptions((author_id,), value)
+
+    def set_subscriptions(self, author_ids, value):
+        for author_id in author_ids:
+            self._subscribed[author_id] = value
+
+    def set_recipe_flag(self, model, recipe_id, value):
+        self.set_recipe_flags(model, (recipe_id,), value)
+
+    def set_recipe_flags(self, model, recipe_ids, value):
+        known = {
+            Favorite: self._favorited,
+            ShoppingCart: self._in_shopping_cart,
+        }[model]
+        for recipe_id in recipe_ids:
+            known[recipe_id] = value
@@ -1,40 +1,54 @@
-import csv
-import hashids
-from io import StringIO
-
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse, HttpResponseNotFound
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.http import HttpResponseNotFound
 from django.shortcuts import redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import (AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly
                                         )
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from api.caching import (RECIPES_VERSION, USER_PROFILES_VERSION,
+                         get_version, tag_registry)
+from api.conditional import conditional_get
+from api.exporters import EXPORTERS
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPagination
+from api.images import release_image_on_commit
+from api.pagination import CustomPagination, FeedPagination
 from api.permissions import IsAuthorOrAdmin
+from api.search import ingredient_index
+from api.shortlinks import get_short_code, resolve_short_code
 from api.mixins import RecipeActionMixin
+from api.viewer_state import ViewerState
 from recipes.models import (
     Favorite,
+    FeedEntry,
     Ingredient,
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Subscription,
-    Tag
+    Tag,
+    add_relations,
+    change_counters,
+    remove_relations
 )
 from .serializers import (
     AvatarSerializer,
+    BatchActionSerializer,
     FavoriteShoppingCartSerializer,
     IngredientSerializer,
+    RecipeReadSerializer,
     RecipeSerializer,
     TagSerializer,
     UserRegistrationSerializer,
@@ -45,6 +59,8 @@ from .serializers import (
 
 User = get_user_model()
 
+EXPORT_CHUNK_SIZE = 500
+
 
 class UserViewSet(ModelViewSet):
     """
@@ -71,17 +87,26 @@ class UserViewSet(ModelViewSet):
         current_user = request.user
 
         if request.method == 'DELETE':
-            subscription = Subscription.objects.filter(
-                user=current_user, author=target_user
-            ).first()
-
-            if not subscription:
+            with transaction.atomic():
+                deleted, _ = Subscription.objects.filter(
+                    user=current_user, author=target_user
+                ).delete()
+                if deleted:
+                    FeedEntry.objects.unfollow(current_user, (target_user,))
+                    change_counters(
+                        User.objects.filter(pk=target_user.pk),
+                        subscribers_count=-1
+                    )
+
+            if not deleted:
                 return Response(
                     {'detail': 'Подписка не найдена.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            subscription.delete()
+            ViewerState.for_request(request).set_subscribed(
+                target_user.pk, False
+            )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         if target_user == current_user:
@@ -90,14 +115,24 @@ class UserViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if Subscription.objects.filter(
-                user=current_user, author=target_user).exists():
+        with transaction.atomic():
+            _, created = Subscription.objects.get_or_create(
+                user=current_user, author=target_user
+            )
+            if created:
+                FeedEntry.objects.follow(current_user, (target_user,))
+                change_counters(
+                    User.objects.filter(pk=target_user.pk),
+                    subscribers_count=1
+                )
+
+        if not created:
             return Response(
                 {'detail': 'Вы уже подписаны на этого пользователя.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        Subscription.objects.create(user=current_user, author=target_user)
+        ViewerState.for_request(request).set_subscribed(target_user.pk, True)
 
         context = self.get_serializer_context()
         context['recipes_limit'] = request.query_params.get('recipes_limit')
@@ -106,6 +141,72 @@ class UserViewSet(ModelViewSet):
             target_user, context=context).data
         return Response(user_data, status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe',
+        permission_classes=[IsAuthenticated]
+    )
+    def subscribe_batch(self, request):
+        """
+        Подписка на нескольких авторов или отписка от них одним запросом.
+
+        В ответе для каждого идентификатора указан результат:
+        created, exists, deleted, absent, not_found или self.
+        """
+        serializer = BatchActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        adding = request.method == 'POST'
+
+        with transaction.atomic():
+            authors = {
+                author.pk: author for author in User.objects.filter(
+                    pk__in=ids
+                ).exclude(pk=user.pk).only('pk')
+            }
+            # Лента и счётчики меняются только для подписок, которые
+            # этот запрос действительно создал или удалил.
+            if adding:
+                changed = add_relations(Subscription, user, 'author', [
+                    pk for pk in ids if pk in authors
+                ])
+                FeedEntry.objects.follow(
+                    user, [authors[pk] for pk in changed]
+                )
+                statuses = ('created', 'exists')
+            else:
+                changed = remove_relations(
+                    Subscription, user, 'author', authors
+                )
+                FeedEntry.objects.unfollow(user, changed)
+                statuses = ('deleted', 'absent')
+
+            if changed:
+                change_counters(
+                    User.objects.filter(pk__in=changed),
+                    subscribers_count=1 if adding else -1
+                )
+
+        if changed:
+            viewer_state = ViewerState.for_request(request)
+            viewer_state.set_subscriptions(changed, adding)
+            viewer_state.touch()
+
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'self' if pk == user.pk
+                    else 'not_found' if pk not in authors
+                    else statuses[0] if pk in changed
+                    else statuses[1]
+                )
+            }
+            for pk in ids
+        ]})
+
     @action(
         detail=False,
         methods=['get'],
@@ -114,10 +215,7 @@ class UserViewSet(ModelViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        author_ids = Subscription.objects.filter(
-            user=user).values_list('author', flat=True)
-
-        authors = User.objects.filter(id__in=author_ids)
+        authors = User.objects.filter(subscribers__user=user)
 
         context = self.get_serializer_context()
         context['recipes_limit'] = request.query_params.get('recipes_limit')
@@ -158,19 +256,27 @@ class UserAvatarView(APIView):
 
     permission_classes = [IsAuthenticated]
 
+    @transaction.atomic
     def put(self, request, *args, **kwargs):
         user = request.user
+        old_avatar = user.avatar.name
         serializer = AvatarSerializer(user, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
+        if user.avatar.name != old_avatar:
+            release_image_on_commit(User, 'avatar', old_avatar)
+
         return Response({
             'avatar': request.build_absolute_uri(user.avatar.url)
         }, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
         user = request.user
-        user.avatar.delete(save=True)
+        old_avatar = user.avatar.name
+        user.avatar = None
+        user.save(update_fields=['avatar'])
+        release_image_on_commit(User, 'avatar', old_avatar)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -184,6 +290,23 @@ class TagViewSet(ModelViewSet):
     http_method_names = ['get']
     pagination_class = None
 
+    def get_validators(self, request, *args, **kwargs):
+        return (tag_registry.get_version(),), None
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return Response(tag_registry.all())
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            data = tag_registry.get_data(int(kwargs[self.lookup_field]))
+        except ValueError:
+            data = None
+        if data is None:
+            raise NotFound
+        return Response(data)
+
 
 class RecipeViewSet(ModelViewSet, RecipeActionMixin):
     """
@@ -197,9 +320,99 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    representation_actions = ('list', 'retrieve', 'feed')
+    anonymous_cache_actions = ('list', 'retrieve')
+
+    @staticmethod
+    def with_related(queryset):
+        """
+        Подгружает автора, теги и ингредиенты рецептов
+        фиксированным числом запросов.
+        """
+        return queryset.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch(
+                'ingredient_in_recipes',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def get_serializer_class(self):
+        if self.action in self.representation_actions:
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.representation_actions:
+            return self.with_related(queryset)
+        return queryset
+
+    def _refresh_instance(self, serializer):
+        """
+        Перечитывает сохранённый рецепт вместе со связанными объектами,
+        чтобы ответ на запись строился за фиксированное число запросов.
+        """
+        serializer.instance = self.with_related(
+            Recipe.objects.filter(pk=serializer.instance.pk)
+        ).get()
+
+    def get_validators(self, request, *args, **kwargs):
+        versions = (
+            ViewerState.get_version(request.user),
+            tag_registry.get_version(),
+            ingredient_index.get_version(),
+            get_version(USER_PROFILES_VERSION),
+        )
+
+        if self.action == 'retrieve':
+            try:
+                updated_at = Recipe.objects.filter(
+                    pk=kwargs[self.lookup_field]
+                ).values_list('updated_at', flat=True).first()
+            except ValueError:
+                return None
+
+            if updated_at is None:
+                return None
+            last_modified = (
+                updated_at if request.user.is_anonymous else None
+            )
+            return (*versions, updated_at), last_modified
+
+        if request.query_params.get('ordering') in (
+            RecipeFilter.counter_orderings
+        ):
+            return None
+        return (*versions, get_version(RECIPES_VERSION)), None
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        self._refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self._refresh_instance(serializer)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Счётчики и списки покупок обновляются в pre_delete, который
+        # сработал бы и для уже удалённой строки: блокировка не даёт
+        # параллельному запросу вычесть их второй раз.
+        if Recipe.objects.select_for_update().filter(pk=instance.pk).exists():
+            instance.delete()
 
     @action(
         detail=True,
@@ -221,6 +434,62 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
             request, ShoppingCart, FavoriteShoppingCartSerializer
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        return self.batch_recipe_action(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_recipe_action(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+
+        Записи ленты читаются по индексу (user, created_at, recipe);
+        рецепты, которые при записи не раскладывались по лентам
+        (fanned_out=False), добавляются из таблицы рецептов.
+        """
+        user = request.user
+        sources = [
+            FeedEntry.objects.filter(user=user).only(
+                'created_at', 'recipe_id'
+            ),
+            Recipe.objects.filter(
+                fanned_out=False, author__subscribers__user=user
+            ).annotate(recipe_id=F('id')).only('created_at'),
+        ]
+
+        entries = self.paginator.paginate_sources(
+            [source.order_by('-created_at', '-recipe_id')
+             for source in sources],
+            request
+        )
+        recipes = self.with_related(
+            Recipe.objects.filter(pk__in=[e.recipe_id for e in entries])
+        ).in_bulk()
+        serializer = self.get_serializer(
+            [recipes[e.recipe_id] for e in entries if e.recipe_id in recipes],
+            many=True
+        )
+        return self.paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['get'],
@@ -228,8 +497,7 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
     )
     def get_link(self, request, pk=None):
         recipe = self.get_object()
-        hashid = hashids.Hashids(salt='random_salt', min_length=8)
-        short_id = hashid.encode(recipe.id)
+        short_id = get_short_code(recipe)
         short_link = f'{settings.BASE_URL}/s/{short_id}'
         return Response({'short-link': short_link})
 
@@ -239,34 +507,34 @@ class RecipeViewSet(ModelViewSet, RecipeActionMixin):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        user = request.user
+        export_format = request.query_params.get('format', 'csv')
+        exporter_class = EXPORTERS.get(export_format)
+
+        if exporter_class is None or not exporter_class.is_available():
+            return Response(
+                {'detail': 'Неподдерживаемый формат выгрузки.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         ingredients = (
-            IngredientInRecipe.objects
-            .filter(recipe__in_shopping_cart__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingListItem.objects
+            .filter(user=request.user)
             .order_by('ingredient__name')
+            .values_list(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'amount'
+            )
         )
 
-        output = StringIO()
-        output.write('\ufeff')
-
-        writer = csv.writer(output)
-        writer.writerow(['Ингредиенты', 'Количество'])
-
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            total_amount = ingredient['total_amount']
-            writer.writerow([f'{name} ({unit})', total_amount])
+        return exporter_class(
+            ingredients.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ).get_response()
 
-        response = HttpResponse(
-            output.getvalue(), content_type='text/csv; charset=utf-8'
-        )
-        response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.csv"'
-        )
-        return response
+    def perform_content_negotiation(self, request, force=False):
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
 
 
 class IngredientViewSet(ModelViewSet):
@@ -282,13 +550,38 @@ class IngredientViewSet(ModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('^name',)
 
+    def get_validators(self, request, *args, **kwargs):
+        return (ingredient_index.get_version(),), None
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        search = request.query_params.get(api_settings.SEARCH_PARAM)
+
+        if name:
+            ingredients = ingredient_index.search(name)
+            if search:
+                prefix = search.strip().lower()
+                ingredients = [
+                    ingredient for ingredient in ingredients
+                    if ingredient['name'].lower().startswith(prefix)
+                ]
+        elif search:
+            ingredients = ingredient_index.search(search, prefix_only=True)
+        else:
+            return super().list(request, *args, **kwargs)
+
+        return Response(ingredients)
+
 
 def redirect_to_recipe(request, short_id):
-    hashid = hashids.Hashids(salt='random_salt', min_length=8)
-    decoded_id = hashid.decode(short_id)
+    path = resolve_short_code(short_id)
 
-    if decoded_id:
-        recipe_id = decoded_id[0]
-        return redirect(f'/recipes/{recipe_id}/')
+    if path is not None:
+        return redirect(path)
 
     return HttpResponseNotFound('Рецепт не найден')
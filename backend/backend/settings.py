@@ -26,6 +26,10 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 
 BASE_URL = os.getenv('BASE_URL')
 
+SHORT_LINK_SALT = os.getenv('SHORT_LINK_SALT', 'random_salt')
+SHORT_LINK_MIN_LENGTH = 8
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 # Application definition
 
@@ -36,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -47,7 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.SQLTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ShortLinkMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +98,20 @@ DATABASES = {
     }
 }
 
+# Версии реестров, ETag и состояния зрителя должны быть общими для всех
+# процессов gunicorn, поэтому кэш в памяти процесса допустим только
+# при одном процессе (WEB_CONCURRENCY=1).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'django_cache'),
+    }
+}
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -133,6 +154,8 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHORT_LINK_MAP_PATH = os.path.join(MEDIA_ROOT, 'short_links', 'recipes.map')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -144,10 +167,89 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50
 }
 
+# Сериализация JSON в API: orjson или стандартный модуль json.
+API_JSON_BACKEND = os.getenv('API_JSON_BACKEND', 'orjson')
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+IMAGE_VARIANT_FORMAT = os.getenv('IMAGE_VARIANT_FORMAT', 'WEBP')
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 2560))
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 1000))
+
+BATCH_ACTION_MAX_SIZE = int(os.getenv('BATCH_ACTION_MAX_SIZE', 100))
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+# Как часто писать в лог статистику кэша ответов, в секундах (0 — никогда).
+RESPONSE_CACHE_STATS_INTERVAL = int(
+    os.getenv('RESPONSE_CACHE_STATS_INTERVAL', 300)
+)
+
+# Окружение развёртывания: production, staging или development.
+DEPLOY_ENVIRONMENT = os.getenv('DEPLOY_ENVIRONMENT', 'production')
+
+# Доля запросов, для которых замеряются запросы к базе (0 — выключено).
+SQL_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv(
+    'SQL_INSTRUMENTATION_SAMPLE_RATE',
+    0 if DEPLOY_ENVIRONMENT == 'production' else 1
+))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'api.response_cache': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+PAGINATION_APPROXIMATE_COUNT_THRESHOLD = int(
+    os.getenv('PAGINATION_APPROXIMATE_COUNT_THRESHOLD', 0)
+)
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = int(
+    os.getenv('ADMIN_APPROXIMATE_COUNT_THRESHOLD', 100000)
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
@@ -1,19 +1,135 @@
+from collections import Counter, defaultdict
+
 from django.contrib import admin
+from django.db import transaction
 
+from api.pagination import ApproximateCountPaginator
+from .admin_filters import AutocompleteFilter
 from .models import (
     CustomUser,
     Favorite,
+    FeedEntry,
     Ingredient,
     IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Subscription,
-    Tag
+    Tag,
+    change_counters,
+    sync_ingredient_ids,
+    tags_mask
 )
 
 
+class AdminPaginator(ApproximateCountPaginator):
+    threshold_setting = 'ADMIN_APPROXIMATE_COUNT_THRESHOLD'
+
+
+class UserAutocompleteFilter(AutocompleteFilter):
+    title = 'пользователю'
+    field_name = 'user'
+
+
+class AuthorAutocompleteFilter(AutocompleteFilter):
+    title = 'автору'
+    field_name = 'author'
+
+
+class RecipeAutocompleteFilter(AutocompleteFilter):
+    title = 'рецепту'
+    field_name = 'recipe'
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Базовый класс админки для больших таблиц: число строк берётся
+    из статистики планировщика, а полный COUNT(*) не выполняется.
+    """
+
+    paginator = AdminPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if (
+                isinstance(list_filter, type)
+                and issubclass(list_filter, AutocompleteFilter)
+            ):
+                return media + list_filter.get_media(self.model, self)
+        return media
+
+
+class UserRelationAdmin(ScalableModelAdmin):
+    """
+    Базовый класс админки связей пользователя с рецептом или автором:
+    избранного, корзины и подписок.
+
+    Как и в API, счётчик counter_field связанного объекта меняется
+    на число действительно созданных и удалённых строк.
+    """
+
+    target_field = 'recipe'
+    counter_field = None
+
+    def target_id(self, obj):
+        return getattr(obj, f'{self.target_field}_id')
+
+    def change_targets(self, target_ids, delta):
+        by_count = defaultdict(list)
+        for pk, count in Counter(target_ids).items():
+            by_count[count].append(pk)
+        target_model = self.model._meta.get_field(
+            self.target_field
+        ).related_model
+        for count, pks in by_count.items():
+            change_counters(
+                target_model.objects.filter(pk__in=pks),
+                **{self.counter_field: delta * count}
+            )
+
+    def relations_added(self, pairs):
+        self.change_targets([target_id for _, target_id in pairs], 1)
+
+    def relations_removed(self, pairs):
+        self.change_targets([target_id for _, target_id in pairs], -1)
+
+    def save_model(self, request, obj, form, change):
+        old = None
+        if change:
+            old = self.model.objects.filter(pk=obj.pk).values_list(
+                'user_id', f'{self.target_field}_id'
+            ).first()
+        super().save_model(request, obj, form, change)
+        new = (obj.user_id, self.target_id(obj))
+        if old != new:
+            if old is not None:
+                self.relations_removed([old])
+            self.relations_added([new])
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        deleted, _ = self.model.objects.filter(pk=obj.pk).delete()
+        if deleted:
+            self.relations_removed([(obj.user_id, self.target_id(obj))])
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        pairs = list(
+            queryset.select_for_update().values_list(
+                'user_id', f'{self.target_field}_id'
+            )
+        )
+        self.model.objects.filter(
+            pk__in=queryset.values('pk')
+        ).delete()
+        self.relations_removed(pairs)
+
+
 @admin.register(CustomUser)
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(ScalableModelAdmin):
 
     list_display = (
         'email',
@@ -21,7 +137,9 @@ class CustomUserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'password',
-        'avatar'
+        'avatar',
+        'recipes_count',
+        'subscribers_count'
     )
     list_editable = (
         'username',
@@ -31,38 +149,65 @@ class CustomUserAdmin(admin.ModelAdmin):
         'avatar'
     )
     search_fields = (
-        'email',
-        'username'
+        '^email',
+        '^username'
     )
     empty_value_display = 'Не задано'
     list_per_page = 10
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(UserRelationAdmin):
+
+    target_field = 'author'
+    counter_field = 'subscribers_count'
+
+    @staticmethod
+    def group_by_user(pairs):
+        authors = defaultdict(list)
+        for user_id, author_id in pairs:
+            authors[user_id].append(author_id)
+        return authors.items()
+
+    def relations_added(self, pairs):
+        super().relations_added(pairs)
+        for user_id, author_ids in self.group_by_user(pairs):
+            FeedEntry.objects.follow(
+                CustomUser(pk=user_id),
+                [CustomUser(pk=author_id) for author_id in author_ids]
+            )
+
+    def relations_removed(self, pairs):
+        super().relations_removed(pairs)
+        for user_id, author_ids in self.group_by_user(pairs):
+            FeedEntry.objects.unfollow(CustomUser(pk=user_id), author_ids)
 
     list_display = (
         'user',
         'author'
     )
     list_editable = ('author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
     search_fields = (
-        'user',
-        'author'
+        '^user__email',
+        '^user__username',
+        '^author__email',
+        '^author__username'
     )
-    list_filter = ('user', 'author')
+    list_filter = (UserAutocompleteFilter, AuthorAutocompleteFilter)
     list_per_page = 10
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableModelAdmin):
 
     list_display = (
         'name',
         'measurement_unit'
     )
     list_editable = ('measurement_unit',)
-    search_fields = ('name',)
+    search_fields = ('^name',)
     list_per_page = 20
 
 
@@ -86,7 +231,7 @@ class IngredientInRecipeInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableModelAdmin):
 
     list_display = (
         'name',
@@ -105,36 +250,81 @@ class RecipeAdmin(admin.ModelAdmin):
         'image',
         'cooking_time'
     )
+    list_select_related = ('author',)
     search_fields = (
-        'name',
-        'author__username'
+        '^name',
+        '^author__username'
     )
     list_filter = ('tags',)
     empty_value_display = 'Не задано'
     list_per_page = 10
     inlines = (IngredientInRecipeInline,)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Создание и удаление рецепта учитывают сигналы, здесь —
+        # только перенос рецепта к другому автору.
+        if change and 'author' in form.changed_data:
+            change_counters(
+                CustomUser.objects.filter(pk=form.initial['author']),
+                recipes_count=-1
+            )
+            change_counters(
+                CustomUser.objects.filter(pk=obj.author_id), recipes_count=1
+            )
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        old_amounts = ShoppingListItem.objects.recipe_amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        recipes = Recipe.objects.filter(pk=recipe.pk)
+        sync_ingredient_ids(recipes)
+        recipes.update(tags_mask=tags_mask(recipe.tags.all()))
+        ShoppingListItem.objects.change_recipe(
+            recipe,
+            old_amounts,
+            ShoppingListItem.objects.recipe_amounts(recipe)
+        )
+        if not change:
+            FeedEntry.objects.fan_out(recipe)
+
     @admin.display(description='Текст')
     def short_text(self, obj):
         return obj.text if len(obj.text) < 100 else obj.text[:100] + '...'
 
+    @admin.display(
+        description='Количество добавлений в избранное',
+        ordering='favorites_count'
+    )
     def get_favorites_count(self, obj):
-        return obj.favorited_by.count()
-
-    get_favorites_count.short_description = 'Количество добавлений в избранное'
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(UserRelationAdmin):
 
+    counter_field = 'favorites_count'
     list_display = ('user', 'recipe')
-    search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    search_fields = ('^user__username', '^recipe__name')
+    list_filter = (UserAutocompleteFilter, RecipeAutocompleteFilter)
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(UserRelationAdmin):
 
+    counter_field = 'in_carts_count'
     list_display = ('user', 'recipe')
-    search_fields = ('user__username', 'recipe__name')
-    list_filter = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    search_fields = ('^user__username', '^recipe__name')
+    list_filter = (UserAutocompleteFilter, RecipeAutocompleteFilter)
+
+    def relations_added(self, pairs):
+        super().relations_added(pairs)
+        ShoppingListItem.objects.rebuild({user_id for user_id, _ in pairs})
+
+    def relations_removed(self, pairs):
+        super().relations_removed(pairs)
+        ShoppingListItem.objects.rebuild({user_id for user_id, _ in pairs})
@@ -0,0 +1,57 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Фильтр списка по внешнему ключу с выбором значения через
+    автодополнение вместо полного списка связанных объектов.
+
+    Из базы загружается только выбранный объект, поэтому фильтр
+    не зависит от размера связанной таблицы. Связанная модель должна
+    быть зарегистрирована в админке с search_fields.
+    """
+
+    template = 'admin/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        super().__init__(request, params, model, model_admin)
+
+        field = model._meta.get_field(self.field_name)
+        self.widget = AutocompleteSelect(field, model_admin.admin_site)
+        form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=self.widget,
+            required=False
+        )
+        self.widget_id = f'autocomplete-filter-{self.field_name}'
+        value = self.value()
+        self.rendered_widget = form_field.widget.render(
+            self.parameter_name,
+            value if value and value.isdigit() else None,
+            {'id': self.widget_id}
+        )
+
+    @classmethod
+    def get_media(cls, model, model_admin):
+        field = model._meta.get_field(cls.field_name)
+        return AutocompleteSelect(field, model_admin.admin_site).media
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        try:
+            return queryset.filter(**{self.parameter_name: int(value)})
+        except ValueError as error:
+            raise IncorrectLookupParameters(error)
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:28
+
+import hashids
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_short_codes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    encoder = hashids.Hashids(
+        salt=settings.SHORT_LINK_SALT,
+        min_length=settings.SHORT_LINK_MIN_LENGTH
+    )
+    recipes = list(Recipe.objects.filter(short_code__isnull=True).only('id'))
+    for recipe in recipes:
+        recipe.short_code = encoder.encode(recipe.id)
+    Recipe.objects.bulk_update(recipes, ['short_code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='short_code',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='Короткий код ссылки'),
+        ),
+        migrations.RunPython(fill_short_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# Поиск в админке ищет по префиксу (istartswith), то есть выполняет
+# UPPER("поле"::text) LIKE 'ПРЕФИКС%'. Такие условия обслуживаются
+# B-tree индексом по тому же выражению с классом операторов
+# text_pattern_ops независимо от правил сортировки базы данных.
+SEARCH_INDEXES = (
+    ('recipes_customuser', 'email', 'user_email_upper_idx'),
+    ('recipes_customuser', 'username', 'user_username_upper_idx'),
+    ('recipes_recipe', 'name', 'recipe_name_upper_idx'),
+    ('recipes_ingredient', 'name', 'ingredient_name_upper_idx'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                f'CREATE INDEX {index} ON {table} '
+                f'(UPPER({column}::text) text_pattern_ops);'
+            ),
+            reverse_sql=f'DROP INDEX IF EXISTS {index};'
+        )
+        for table, column, index in SEARCH_INDEXES
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def fill_tag_bits(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    for bit, tag in enumerate(Tag.objects.order_by('id')):
+        tag.bit = bit
+        tag.save(update_fields=('bit',))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_ingredient_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.RunPython(fill_tag_bits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True, validators=[django.core.validators.MaxValueValidator(62)], verbose_name='Бит в маске тегов'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunSQL(
+            'UPDATE recipes_recipe AS recipe SET tags_mask = COALESCE(('
+            'SELECT bit_or(1::bigint << tag.bit) '
+            'FROM recipes_recipe_tags AS link '
+            'INNER JOIN recipes_tag AS tag ON tag.id = link.tag_id '
+            'WHERE link.recipe_id = recipe.id), 0)',
+            migrations.RunSQL.noop
+        ),
+    ]
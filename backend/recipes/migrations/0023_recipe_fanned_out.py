@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_not_fanned_out(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(
+        author__subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_tag_bits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Разложен в ленты подписчиков'),
+        ),
+        migrations.RunPython(mark_not_fanned_out, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', 'created_at', 'id'], name='recipe_not_fanned_out_idx'),
+        ),
+    ]
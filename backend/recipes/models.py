@@ -1,9 +1,164 @@
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.core.validators import MinValueValidator
-from django.db import models
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.storage import image_storage
+
+# Маска тегов хранится в знаковом bigint, старший бит не используется.
+TAG_MASK_BITS = 63
+
+
+def change_counters(queryset, **deltas):
+    """
+    Атомарно изменяет счётчики у всех объектов выборки
+    одним UPDATE с выражениями F(), не опускаясь ниже нуля.
+    """
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+class CountersMixin:
+    """
+    Счётчики из counter_fields меняются только через change_counters.
+    Обычное сохранение существующего объекта их не записывает: иначе
+    значения, прочитанные до параллельного изменения, затёрли бы его.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class LoadedImagesMixin:
+    """
+    Запоминает имена файлов из image_fields, с которыми объект
+    загружен из базы, чтобы при сохранении без запроса узнать,
+    изменилось ли изображение.
+    """
+
+    image_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_images = {
+            name: instance.__dict__[name]
+            for name in cls.image_fields if name in field_names
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self._loaded_images = {
+            **getattr(self, '_loaded_images', {}),
+            **{
+                name: getattr(self, name).name for name in self.image_fields
+                if (fields is None or name in fields)
+                and name in self.__dict__
+            },
+        }
+
+
+def batched(iterable, size):
+    """
+    Разбивает итерируемый объект на списки не длиннее size,
+    не загружая его в память целиком.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _relation_columns(model, field):
+    quote = connection.ops.quote_name
+    return (
+        quote(model._meta.db_table),
+        quote(model._meta.get_field('user').column),
+        quote(model._meta.get_field(field).column),
+    )
 
 
-class CustomUser(AbstractUser):
+def add_relations(model, user, field, ids):
+    """
+    Создаёт связи пользователя с объектами ids (избранное, корзина,
+    подписки) одним INSERT ... ON CONFLICT DO NOTHING и возвращает
+    множество идентификаторов, для которых строка действительно
+    вставлена. Параллельный запрос с теми же ids получит только
+    те, что вставил сам, поэтому счётчики не изменятся дважды.
+    """
+    if not ids:
+        return set()
+    table, user_column, column = _relation_columns(model, field)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {column}) '
+            f'SELECT %s, unnest(%s::integer[]) '
+            f'ON CONFLICT DO NOTHING RETURNING {column}',
+            [user.pk, list(ids)]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def remove_relations(model, user, field, ids):
+    """
+    Удаляет связи пользователя с объектами ids одним DELETE
+    и возвращает множество идентификаторов действительно
+    удалённых строк.
+    """
+    if not ids:
+        return set()
+    table, user_column, column = _relation_columns(model, field)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE {user_column} = %s AND {column} = ANY(%s::integer[]) '
+            f'RETURNING {column}',
+            [user.pk, list(ids)]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def sync_ingredient_ids(queryset):
+    """
+    Переписывает у рецептов выборки денормализованный массив
+    идентификаторов ингредиентов по таблице IngredientInRecipe.
+    """
+    ingredient_ids = IngredientInRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        ids=ArrayAgg('ingredient_id', ordering='ingredient_id')
+    ).values('ids')
+    return queryset.update(ingredient_ids=Coalesce(
+        Subquery(ingredient_ids),
+        Value([], output_field=ArrayField(models.IntegerField()))
+    ))
+
+
+class CustomUser(CountersMixin, LoadedImagesMixin, AbstractUser):
 
     email = models.EmailField(
         unique=True, verbose_name='Электронная почта'
@@ -19,10 +174,29 @@ class CustomUser(AbstractUser):
 
     avatar = models.ImageField(
         upload_to='users/', blank=True,
-        null=True, verbose_name='Аватар'
+        null=True, storage=image_storage,
+        verbose_name='Аватар'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество рецептов'
     )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество подписчиков'
+    )
+
+    counter_fields = ('recipes_count', 'subscribers_count')
+    image_fields = ('avatar',)
 
     class Meta:
+        ordering = ('date_joined', 'id')
+        indexes = [
+            models.Index(
+                fields=('date_joined', 'id'),
+                name='user_date_joined_id_idx',
+            )
+        ]
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
@@ -68,6 +242,12 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            )
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -75,6 +255,13 @@ class Ingredient(models.Model):
         return self.name
 
 
+def tags_mask(tags):
+    mask = 0
+    for tag in tags:
+        mask |= tag.mask
+    return mask
+
+
 class Tag(models.Model):
 
     name = models.CharField(
@@ -85,6 +272,11 @@ class Tag(models.Model):
         max_length=32, unique=True,
         verbose_name='URL-метка'
     )
+    bit = models.PositiveSmallIntegerField(
+        unique=True, editable=False,
+        validators=[MaxValueValidator(TAG_MASK_BITS - 1)],
+        verbose_name='Бит в маске тегов'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -93,8 +285,50 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def mask(self):
+        return 1 << self.bit
+
+    @classmethod
+    def free_bit(cls):
+        used = set(cls.objects.values_list('bit', flat=True))
+        return next(
+            (bit for bit in range(TAG_MASK_BITS) if bit not in used), None
+        )
+
+    def clean(self):
+        if self.bit is None and self.free_bit() is None:
+            raise ValidationError(
+                f'Нельзя создать больше {TAG_MASK_BITS} тегов.'
+            )
 
-class Recipe(models.Model):
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+
+        # Блокировка до конца транзакции не даёт параллельно
+        # создаваемым тегам выбрать один и тот же свободный бит;
+        # чтение тегов она не блокирует.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'LOCK TABLE '
+                    f'{connection.ops.quote_name(self._meta.db_table)} '
+                    'IN SHARE ROW EXCLUSIVE MODE'
+                )
+            self.bit = self.free_bit()
+            if self.bit is None:
+                raise ValidationError(
+                    f'Нельзя создать больше {TAG_MASK_BITS} тегов.'
+                )
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.bit = None
+                raise
+
+
+class Recipe(CountersMixin, LoadedImagesMixin, models.Model):
 
     tags = models.ManyToManyField(
         Tag, related_name='recipes',
@@ -116,7 +350,8 @@ class Recipe(models.Model):
         verbose_name='Название'
     )
     image = models.ImageField(
-        upload_to='recipes', verbose_name='Изображение'
+        upload_to='recipes', storage=image_storage,
+        verbose_name='Изображение'
     )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.IntegerField(
@@ -124,8 +359,70 @@ class Recipe(models.Model):
         help_text='Время приготовления (в минутах)',
         verbose_name='Время приготовления'
     )
+    short_code = models.CharField(
+        max_length=32, unique=True, null=True,
+        blank=True, editable=False,
+        verbose_name='Короткий код ссылки'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Дата создания'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество добавлений в корзину'
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    ingredient_ids = ArrayField(
+        models.IntegerField(), default=list, editable=False,
+        verbose_name='Идентификаторы ингредиентов'
+    )
+    tags_mask = models.BigIntegerField(
+        default=0, editable=False,
+        verbose_name='Маска тегов'
+    )
+    fanned_out = models.BooleanField(
+        default=True, editable=False,
+        verbose_name='Разложен в ленты подписчиков'
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+    image_fields = ('image',)
 
     class Meta:
+        ordering = ('-created_at', '-id')
+        indexes = [
+            models.Index(
+                fields=('created_at', 'id'),
+                name='recipe_created_at_id_idx',
+            ),
+            models.Index(
+                fields=('favorites_count', 'id'),
+                name='recipe_favorites_count_id_idx',
+            ),
+            GinIndex(
+                fields=('search_vector',),
+                name='recipe_search_vector_idx',
+            ),
+            GinIndex(
+                fields=('ingredient_ids',),
+                name='recipe_ingredient_ids_idx',
+            ),
+            models.Index(
+                fields=('author', 'created_at', 'id'),
+                name='recipe_not_fanned_out_idx',
+                condition=models.Q(fanned_out=False),
+            )
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -214,3 +511,300 @@ class ShoppingCart(models.Model):
 
         def __str__(self):
             return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """
+    Менеджер агрегированного списка покупок.
+
+    Поддерживает суммы ингредиентов по пользователям в актуальном
+    состоянии при изменении корзины и состава рецептов.
+    """
+
+    @staticmethod
+    def recipe_amounts(recipe):
+        return dict(
+            IngredientInRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')
+        )
+
+    def apply_amounts(self, user_ids, amounts):
+        """
+        Прибавляет к списку покупок пользователей количество
+        ингредиентов (отрицательное значение уменьшает сумму).
+        """
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, amount in amounts.items()
+                    if amount > 0
+                ],
+                ignore_conflicts=True
+            )
+            items = list(
+                self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts
+                ).order_by('pk')
+            )
+            for item in items:
+                item.amount += amounts[item.ingredient_id]
+            self.bulk_update(items, ['amount'])
+            self.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=amounts,
+                amount__lte=0
+            ).delete()
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        return dict(
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values('ingredient_id').annotate(
+                total=Sum('amount')
+            ).values_list('ingredient_id', 'total')
+        )
+
+    def add_recipe(self, user, recipe):
+        self.add_recipes(user, (recipe.pk,))
+
+    def remove_recipe(self, user, recipe):
+        self.remove_recipes(user, (recipe.pk,))
+
+    def add_recipes(self, user, recipe_ids):
+        self.apply_amounts((user.pk,), self.recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        self.apply_amounts(
+            (user.pk,),
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount
+                in self.recipes_amounts(recipe_ids).items()
+            }
+        )
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """
+        Переносит изменение состава рецепта в списки покупок
+        всех пользователей, у которых рецепт лежит в корзине.
+        """
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        self.apply_amounts(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            deltas
+        )
+
+    def expected_amounts(self, user_ids=None):
+        """
+        Считает списки покупок заново по корзинам пользователей.
+        """
+        lookup = {'recipe__in_shopping_cart__isnull': False}
+        if user_ids is not None:
+            lookup = {'recipe__in_shopping_cart__user_id__in': user_ids}
+        queryset = IngredientInRecipe.objects.filter(**lookup)
+        return {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in queryset.values(
+                'recipe__in_shopping_cart__user_id', 'ingredient_id'
+            ).annotate(
+                total_amount=Sum('amount')
+            ).values_list(
+                'recipe__in_shopping_cart__user_id',
+                'ingredient_id',
+                'total_amount'
+            )
+        }
+
+    def rebuild(self, user_ids):
+        user_ids = list(user_ids)
+        with transaction.atomic():
+            self.filter(user_id__in=user_ids).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for (user_id, ingredient_id), amount
+                in self.expected_amounts(user_ids).items()
+            )
+
+
+class ShoppingListItem(models.Model):
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        default=0, verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
+class FeedEntryManager(models.Manager):
+    """
+    Менеджер ленты подписок.
+
+    Новый рецепт раскладывается в ленты подписчиков автора при записи.
+    Для авторов, у которых подписчиков больше FEED_FANOUT_LIMIT,
+    записи не создаются: рецепт помечается fanned_out=False и
+    добавляется в ленту при чтении. Решение хранится в рецепте,
+    поэтому не зависит от того, как позже меняется число подписчиков.
+    """
+
+    @staticmethod
+    def is_fanned_out(author):
+        return author.subscribers_count <= settings.FEED_FANOUT_LIMIT
+
+    def _insert(self, entries):
+        for batch in batched(entries, settings.FEED_FANOUT_BATCH_SIZE):
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def fan_out(self, recipe):
+        """
+        Добавляет рецепт в ленты всех подписчиков автора пачками.
+        """
+        if not self.is_fanned_out(recipe.author):
+            recipe.fanned_out = False
+            Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+            return
+
+        subscriber_ids = Subscription.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True).iterator(
+            chunk_size=settings.FEED_FANOUT_BATCH_SIZE
+        )
+        self._insert(
+            self.model(
+                user_id=user_id,
+                author_id=recipe.author_id,
+                recipe_id=recipe.pk,
+                created_at=recipe.created_at
+            )
+            for user_id in subscriber_ids
+        )
+
+    def follow(self, user, authors):
+        """
+        Заполняет ленту пользователя разложенными рецептами новых
+        авторов; остальные их рецепты лента берёт при чтении.
+        """
+        author_ids = [author.pk for author in authors]
+        if not author_ids:
+            return
+
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids, fanned_out=True
+        ).values_list(
+            'id', 'author_id', 'created_at'
+        ).iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE)
+        self._insert(
+            self.model(
+                user_id=user.pk,
+                author_id=author_id,
+                recipe_id=recipe_id,
+                created_at=created_at
+            )
+            for recipe_id, author_id, created_at in recipes
+        )
+
+    def unfollow(self, user, authors):
+        self.filter(user=user, author__in=authors).delete()
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Время создания скопировано из рецепта, чтобы
+    страница ленты читалась одним проходом по индексу.
+    """
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        db_index=False,
+        verbose_name='Пользователь'
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    created_at = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        ordering = ('-created_at', '-recipe_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', 'created_at', 'recipe'),
+                name='feed_user_created_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx',
+            )
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
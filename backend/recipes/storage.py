@@ -0,0 +1,98 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+def lock_file_name(name):
+    """
+    Блокирует имя файла до конца текущей транзакции.
+
+    Запись файла и удаление файла, на который больше нет ссылок,
+    берут одну блокировку, поэтому удаление не может пройти между
+    сохранением уже существующего файла и фиксацией ссылки на него.
+    """
+    key = int.from_bytes(
+        hashlib.sha256(name.encode('utf-8')).digest()[:8],
+        'big', signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище для изображений, имена которых
+    вычисляются по хешу содержимого.
+
+    Имя файла всегда строится из SHA-256 содержимого и расширения
+    исходного имени, поэтому разные файлы с одинаковым именем
+    (например, загруженные через админку) не перезаписывают друг
+    друга, а повторная загрузка того же содержимого не выполняет
+    запись. Файл записывается атомарно через временный файл
+    в том же каталоге.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _write_temp(self, name, content):
+        """
+        Записывает содержимое во временный файл рядом с name
+        и возвращает путь к нему и SHA-256 содержимого.
+        """
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=directory, prefix='.upload-'
+        )
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, digest.hexdigest()
+
+    def _save(self, name, content):
+        temp_path, digest = self._write_temp(name, content)
+        try:
+            name = os.path.join(
+                os.path.dirname(name),
+                digest + os.path.splitext(name)[1].lower()
+            )
+            lock_file_name(name)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.unlink(temp_path)
+            else:
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    def save_derived(self, name, content):
+        """
+        Сохраняет файл, производный от исходного изображения
+        (например, уменьшенный вариант), под заданным именем,
+        атомарно заменяя прежний.
+        """
+        temp_path, _ = self._write_temp(name, content)
+        try:
+            os.replace(temp_path, self.path(name))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return name
+
+
+image_storage = ContentAddressedStorage()